@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,19 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def inline_background_tasks(settings):
+    # Фоновые задачи проекта в тестах выполняются сразу, без on_commit.
+    settings.BACKGROUND_TASKS_ASYNC = False
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(settings, tmp_path):
+    # Кэш и метрики — во временном каталоге, а не в кэше проекта.
+    from core.test_runner import isolated_settings, skip_exit_snapshot
+
+    skip_exit_snapshot()
+    for name, value in isolated_settings(tmp_path).items():
+        setattr(settings, name, value)
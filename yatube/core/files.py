@@ -0,0 +1,30 @@
+"""Служебные каталоги проекта: кэш и снимки метрик.
+
+Кэш читается через pickle, поэтому чужой пользователь машины не должен
+ни читать эти каталоги, ни подложить свой каталог заранее.
+"""
+import os
+import stat
+
+from django.core.exceptions import ImproperlyConfigured
+
+PRIVATE_MODE = 0o700
+
+
+def ensure_private_dir(path):
+    """Создаёт каталог с правами 0700 и проверяет, что он наш.
+
+    Каталог другого владельца или символическая ссылка — ошибка
+    конфигурации: открывать их файлы небезопасно. Слишком широкие права
+    на своём каталоге сужаются до 0700.
+    """
+    os.makedirs(path, mode=PRIVATE_MODE, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise ImproperlyConfigured(f'{path} — не каталог')
+    if info.st_uid != os.getuid():
+        raise ImproperlyConfigured(
+            f'Каталог {path} принадлежит другому пользователю')
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(path, PRIVATE_MODE)
+    return path
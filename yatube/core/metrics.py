@@ -0,0 +1,289 @@
+"""Метрики в формате Prometheus: гистограммы и счётчики процесса.
+
+Каждый процесс копит значения в памяти и не чаще METRICS_FLUSH_INTERVAL
+сбрасывает снимок в файл <pid>.json каталога METRICS_DIR. Эндпоинт
+/metrics суммирует снимки всех процессов, поэтому за балансировщиком
+не важно, какой воркер ответил на запрос Prometheus.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import suppress
+from functools import wraps
+
+from django.conf import settings
+
+from .files import ensure_private_dir
+
+REQUEST_DURATION = 'yatube_request_duration_seconds'
+DB_DURATION = 'yatube_db_duration_seconds'
+DB_QUERIES = 'yatube_db_queries_total'
+TEMPLATE_DURATION = 'yatube_template_render_seconds'
+CACHE_REQUESTS = 'yatube_cache_requests_total'
+CACHE_TIER_REQUESTS = 'yatube_cache_tier_requests_total'
+
+HELP = {
+    REQUEST_DURATION: 'Время обработки запроса по представлениям.',
+    DB_DURATION: 'Время SQL-запросов за один HTTP-запрос.',
+    DB_QUERIES: 'Число SQL-запросов по представлениям.',
+    TEMPLATE_DURATION: 'Время рендера шаблонов, включая вложенные.',
+    CACHE_REQUESTS: 'Обращения к кэшу фрагментов и карточек.',
+    CACHE_TIER_REQUESTS: 'Обращения к уровням L1 и L2 кэша.',
+}
+
+THUMBNAIL_TEMPLATE = '{% thumbnail %}'
+
+
+class Registry:
+    """Значения метрик одного процесса."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = defaultdict(float)
+        self.flushed = 0.0
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0.0,
+                    'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'buckets': list(self.buckets),
+                'histograms': [
+                    [name, dict(labels), dict(value,
+                                              buckets=list(value['buckets']))]
+                    for (name, labels), value in self.histograms.items()
+                ],
+                'counters': [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.flushed = 0.0
+
+
+registry = Registry(settings.METRICS_BUCKETS)
+
+
+def observe(name, value, **labels):
+    if settings.METRICS_ENABLED:
+        registry.observe(name, value, **labels)
+
+
+def inc(name, value=1, **labels):
+    if settings.METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def cache_result(cache_name, hit):
+    inc(CACHE_REQUESTS, cache=cache_name, result='hit' if hit else 'miss')
+
+
+# Холодный путь текущего запроса потока: запрос заполнял общий кэш
+# или заводил счётчики. По нему QueryBudgetMiddleware выбирает бюджет.
+_request = threading.local()
+
+
+def start_request():
+    _request.cold = False
+
+
+def mark_cold():
+    _request.cold = True
+
+
+def is_cold():
+    return getattr(_request, 'cold', False)
+
+
+def snapshot_path(pid=None):
+    return os.path.join(settings.METRICS_DIR, f'{pid or os.getpid()}.json')
+
+
+def flush(force=False):
+    """Сбрасывает снимок процесса на диск: запись во временный файл
+    и os.replace, чтобы читатель не увидел половину JSON."""
+    if not settings.METRICS_ENABLED:
+        return
+    now = time.monotonic()
+    if not force and now - registry.flushed < settings.METRICS_FLUSH_INTERVAL:
+        return
+    registry.flushed = now
+    ensure_private_dir(settings.METRICS_DIR)
+    path = snapshot_path()
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as snapshot_file:
+        json.dump(registry.snapshot(), snapshot_file)
+    os.replace(tmp_path, path)
+
+
+atexit.register(flush, force=True)
+
+
+def process_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def load_snapshots():
+    """Снимки всех процессов; свой берётся из памяти, а не с диска."""
+    snapshots = [registry.snapshot()]
+    own = f'{os.getpid()}.json'
+    try:
+        names = os.listdir(settings.METRICS_DIR)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        if not name.endswith('.json') or name == own:
+            continue
+        path = os.path.join(settings.METRICS_DIR, name)
+        if not process_alive(name[:-len('.json')]):
+            # Завершившийся воркер: его счётчики уходят, Prometheus
+            # увидит это как обычный сброс счётчика.
+            with suppress(OSError):
+                os.remove(path)
+            continue
+        try:
+            with open(path) as snapshot_file:
+                snapshots.append(json.load(snapshot_file))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def aggregate(snapshots):
+    histograms = {}
+    counters = defaultdict(float)
+    for snapshot in snapshots:
+        buckets = tuple(snapshot['buckets'])
+        for name, labels, value in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            total = histograms.setdefault(key, {
+                'bounds': buckets, 'buckets': [0] * len(buckets),
+                'sum': 0.0, 'count': 0})
+            if total['bounds'] != buckets:
+                # Воркер со старыми границами корзин: без пересчёта
+                # корзин учитываем только сумму и число наблюдений.
+                value = dict(value, buckets=[0] * len(total['bounds']))
+            for index, count in enumerate(value['buckets']):
+                total['buckets'][index] += count
+            total['sum'] += value['sum']
+            total['count'] += value['count']
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(sorted(labels.items())))] += value
+    return histograms, counters
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels)
+    return f'{{{pairs}}}'
+
+
+def format_number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render_metrics():
+    """Текст в формате экспозиции Prometheus 0.0.4."""
+    histograms, counters = aggregate(load_snapshots())
+    lines = []
+    for name in sorted({key[0] for key in histograms}):
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), value in sorted(histograms.items()):
+            if metric != name:
+                continue
+            # Корзины хранятся уже накопленными: value <= bound.
+            for bound, count in zip(value['bounds'], value['buckets']):
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(labels + (('le', bound),)), count))
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(labels + (('le', '+Inf'),)),
+                value['count']))
+            lines.append(f'{name}_sum{format_labels(labels)} '
+                         f'{format_number(value["sum"])}')
+            lines.append(f'{name}_count{format_labels(labels)} '
+                         f'{value["count"]}')
+    for name in sorted({key[0] for key in counters}):
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} counter')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{format_labels(labels)} '
+                             f'{format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed_render(render, label):
+    """Обёртка render(), пишущая время в TEMPLATE_DURATION."""
+    @wraps(render)
+    def wrapper(self, context, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return render(self, context, *args, **kwargs)
+        finally:
+            observe(TEMPLATE_DURATION, time.perf_counter() - start,
+                    template=label(self))
+    wrapper.metrics_wrapped = True
+    return wrapper
+
+
+def template_label(template):
+    name = getattr(template.origin, 'template_name', None) or template.name
+    return name or '<string>'
+
+
+def install_template_timing():
+    """Подменяет Template.render и рендер тега {% thumbnail %}.
+
+    Template.render вызывается и для {% include %}, поэтому время
+    вложенных шаблонов учитывается отдельно под их именами.
+    """
+    from django.template.base import Template
+    if not getattr(Template.render, 'metrics_wrapped', False):
+        Template.render = timed_render(Template.render, template_label)
+    try:
+        from sorl.thumbnail.templatetags.thumbnail import ThumbnailNodeBase
+    except ImportError:
+        return
+    if not getattr(ThumbnailNodeBase.render, 'metrics_wrapped', False):
+        ThumbnailNodeBase.render = timed_render(
+            ThumbnailNodeBase.render, lambda node: THUMBNAIL_TEMPLATE)
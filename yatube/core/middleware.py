@@ -0,0 +1,146 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper: считает запросы и время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def count_queries(counter):
+    """Контекст, в котором запросы всех соединений идут через counter."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(counter))
+    return stack
+
+
+def stream_with(content, counter, finish):
+    """Отдаёт части streaming_content, считая запросы при получении
+    каждой из них, и вызывает finish() после последней."""
+    iterator = iter(content)
+    while True:
+        with count_queries(counter):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+        yield chunk
+    finish()
+
+
+def stream_then(content, finish):
+    """Отдаёт части streaming_content и вызывает finish() после
+    последней."""
+    yield from content
+    finish()
+
+
+class QueryBudgetMiddleware:
+    """Отдаёт число и время SQL-запросов в заголовке Server-Timing и пишет
+    в лог запросы, превысившие бюджет.
+
+    Бюджеты тёплого пути — QUERY_BUDGETS; запрос, который заполнял
+    общий кэш или заводил счётчики (metrics.mark_cold()), сверяется
+    с QUERY_BUDGETS_COLD.
+    У потоковых ответов заголовок уходит до тела, поэтому Server-Timing
+    описывает только запросы до начала потока, а бюджет проверяется
+    после отдачи тела вместе с запросами, сделанными при итерации.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        metrics.start_request()
+        with count_queries(counter):
+            request.query_counter = counter
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        description = f'{counter.count} queries'
+        if response.streaming:
+            description += ' before streaming'
+        timing = (
+            f'db;dur={counter.duration * 1000:.1f};'
+            f'desc="{description}", '
+            f'app;dur={total * 1000:.1f}'
+        )
+        if response.has_header('Server-Timing'):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response['Server-Timing'] = timing
+        if response.streaming:
+            response.streaming_content = stream_with(
+                response.streaming_content, counter,
+                lambda: self.check_budget(request, counter))
+        else:
+            self.check_budget(request, counter)
+        return response
+
+    def check_budget(self, request, counter):
+        view_name = (request.resolver_match.view_name
+                     if request.resolver_match else None)
+        cold = metrics.is_cold()
+        budgets = (settings.QUERY_BUDGETS_COLD if cold
+                   else settings.QUERY_BUDGETS)
+        budget = budgets.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                'Превышен бюджет запросов для %s (%s, %s кэш): %d при '
+                'бюджете %d, %.1f мс в БД',
+                view_name, request.path, 'холодный' if cold else 'тёплый',
+                counter.count, budget, counter.duration * 1000,
+            )
+
+
+class MetricsMiddleware:
+    """Пишет время ответа, время и число SQL-запросов по имени
+    представления. Стоит перед QueryBudgetMiddleware и берёт его
+    счётчик запросов из request.query_counter."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        if response.streaming:
+            # Время и запросы потока известны только после отдачи тела.
+            response.streaming_content = stream_then(
+                response.streaming_content,
+                lambda: self.observe(request, start))
+        else:
+            self.observe(request, start)
+        return response
+
+    def observe(self, request, start):
+        duration = time.perf_counter() - start
+        view_name = (request.resolver_match.view_name
+                     if request.resolver_match else '<unresolved>')
+        metrics.observe(metrics.REQUEST_DURATION, duration, view=view_name)
+        counter = getattr(request, 'query_counter', None)
+        if counter is not None:
+            metrics.observe(metrics.DB_DURATION, counter.duration,
+                            view=view_name)
+            metrics.inc(metrics.DB_QUERIES, counter.count, view=view_name)
+        metrics.flush()
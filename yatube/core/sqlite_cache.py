@@ -0,0 +1,237 @@
+"""Кэш Django в файле SQLite, общий для всех процессов одной машины.
+
+В отличие от LocMemCache воркеры видят записи и инвалидацию друг
+друга, а внешний сервер не нужен. Журнал WAL позволяет читать
+параллельно с записью; запись идёт в коротких транзакциях
+BEGIN IMMEDIATE, поэтому incr атомарен между процессами.
+
+Вытеснение — приближённый LRU: время обращения обновляется не чаще
+ACCESS_RESOLUTION секунд на ключ, а при переполнении MAX_ENTRIES
+сначала удаляются просроченные записи, затем 1/CULL_FREQUENCY давно
+не читавшихся.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .files import ensure_private_dir
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+# Параметров в одном запросе не больше, чем позволяют старые SQLite.
+CHUNK_SIZE = 500
+
+INTEGER_LIMIT = 2 ** 63
+
+
+def encode(value):
+    # Целые хранятся как INTEGER, остальное — pickle.
+    if type(value) is int and -INTEGER_LIMIT <= value < INTEGER_LIMIT:
+        return value
+    return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def decode(value):
+    if isinstance(value, int):
+        return value
+    return pickle.loads(value)
+
+
+def chunked(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def alive(expires, now):
+    return expires is None or expires > now
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self.access_resolution = options.get('ACCESS_RESOLUTION', 1)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Своё соединение у каждого потока и у процесса после fork.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            # Значения распаковываются pickle: файл должен лежать
+            # в нашем закрытом каталоге.
+            ensure_private_dir(os.path.dirname(os.path.abspath(self.path)))
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def write(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version): key for key in keys}
+        for key in keys:
+            self.validate_key(key)
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in chunked(keys):
+            rows = self.connection.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})', chunk)
+            for key, value, expires, accessed in rows:
+                if not alive(expires, now):
+                    continue
+                found[keys[key]] = decode(value)
+                if now - accessed > self.access_resolution:
+                    stale.append(key)
+        for chunk in chunked(stale):
+            self.connection.execute(
+                'UPDATE cache SET accessed = ? '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                [now, *chunk])
+        return found
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'SELECT expires FROM cache WHERE key = ?', [key]).fetchone()
+        return row is not None and alive(row[0], time.time())
+
+    def store(self, connection, rows, timeout, only_missing=False):
+        """Записывает [(ключ, значение)]; возвращает число записанных.
+        only_missing — не трогать живые записи, как в add()."""
+        now = time.time()
+        expires = self.expires(timeout)
+        condition = 'WHERE cache.expires <= excluded.accessed' \
+            if only_missing else ''
+        stored = 0
+        for key, value in rows:
+            self.validate_key(key)
+            stored += connection.execute(
+                'INSERT INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires, '
+                f'accessed = excluded.accessed {condition}',
+                [key, encode(value), expires, now]).rowcount
+        self.cull(connection, now)
+        return stored
+
+    def cull(self, connection, now):
+        if not self._max_entries:
+            return
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        count -= connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', [now]).rowcount
+        if count <= self._max_entries:
+            return
+        if not self._cull_frequency:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY accessed LIMIT ?)', [count // self._cull_frequency])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.write() as connection:
+            self.store(connection, [(self.make_key(key, version), value)],
+                       timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.write() as connection:
+            return bool(self.store(
+                connection, [(self.make_key(key, version), value)], timeout,
+                only_missing=True))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.write() as connection:
+            self.store(connection, [
+                (self.make_key(key, version), value)
+                for key, value in data.items()
+            ], timeout)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        now = time.time()
+        with self.write() as connection:
+            return bool(connection.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                [self.expires(timeout), now, key, now]).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        now = time.time()
+        with self.write() as connection:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                [key]).fetchone()
+            if row is None or not alive(row[1], now):
+                raise ValueError(f"Key '{key}' not found")
+            value = decode(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                [encode(value), now, key])
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        with self.write() as connection:
+            for chunk in chunked(keys):
+                connection.execute(
+                    'DELETE FROM cache '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))})', chunk)
+
+    def clear(self):
+        with self.write() as connection:
+            connection.execute('DELETE FROM cache')
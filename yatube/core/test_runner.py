@@ -0,0 +1,47 @@
+import atexit
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from . import metrics
+
+
+def isolated_settings(directory):
+    """Кэш и снимки метрик в отдельном каталоге: тесты не читают
+    и не очищают кэш работающего проекта и не мешают параллельным
+    запускам."""
+    caches = {
+        alias: {**options, 'LOCATION': f'{directory}/{alias}.sqlite3'}
+        for alias, options in settings.CACHES.items()
+    }
+    return {'CACHES': caches, 'METRICS_DIR': f'{directory}/metrics'}
+
+
+def skip_exit_snapshot():
+    """Снимок метрик при выходе пишется уже без подменённых настроек —
+    в METRICS_DIR проекта, поэтому тестовый процесс его не пишет."""
+    atexit.unregister(metrics.flush)
+
+
+class InlineTasksRunner(DiscoverRunner):
+    """Тесты выполняют фоновые задачи сразу: TestCase не вызывает
+    on_commit, а проверки ждут результат задачи в том же запросе.
+    Асинхронный путь тесты включают явно. Кэш и метрики живут
+    во временном каталоге запуска."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp(prefix='yatube-tests-')
+        self.inline_tasks = override_settings(
+            BACKGROUND_TASKS_ASYNC=False,
+            **isolated_settings(self.directory))
+        self.inline_tasks.enable()
+        skip_exit_snapshot()
+
+    def teardown_test_environment(self, **kwargs):
+        self.inline_tasks.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .. import metrics
+
+User = get_user_model()
+
+TEMP_METRICS_DIR = tempfile.mkdtemp()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+METRICS_TOKEN = 'metrics-token'
+
+
+# Без вариантов для srcset карточка идёт через миниатюры sorl.
+@override_settings(METRICS_DIR=TEMP_METRICS_DIR, MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   IMAGE_VARIANT_FORMATS=(), METRICS_TOKEN=METRICS_TOKEN)
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        Post.objects.create(
+            text='Пост с картинкой', author=cls.user,
+            image=SimpleUploadedFile('small.gif', small_gif, 'image/gif'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def get_metrics(self, token=METRICS_TOKEN):
+        return self.client.get(reverse('core:metrics'),
+                               HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_request_and_template_metrics(self):
+        """Время запроса, SQL, шаблонов и thumbnail попадают в /metrics."""
+        self.client.get(reverse('posts:index'))
+        response = self.get_metrics()
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      body)
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 1', body)
+        self.assertIn('yatube_db_duration_seconds_count'
+                      '{view="posts:index"} 1', body)
+        self.assertIn('template="posts/index.html"', body)
+        self.assertIn('template="posts/includes/paginator.html"', body)
+        self.assertIn('template="{% thumbnail %}"', body)
+        self.assertIn('yatube_cache_requests_total'
+                      '{cache="fragment",result="miss"} 1', body)
+
+    def test_cache_hits_counted(self):
+        """Повторный запрос ленты считается попаданием в кэш фрагмента."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        body = self.get_metrics().content.decode()
+        self.assertIn('yatube_cache_requests_total'
+                      '{cache="fragment",result="hit"} 1', body)
+
+    def test_snapshots_of_other_workers_aggregated(self):
+        """Снимки других процессов суммируются с текущим."""
+        metrics.registry.observe(metrics.REQUEST_DURATION, 0.2, view='x')
+        other = metrics.Registry(settings.METRICS_BUCKETS)
+        other.observe(metrics.REQUEST_DURATION, 0.3, view='x')
+        os.makedirs(TEMP_METRICS_DIR, exist_ok=True)
+        with open(metrics.snapshot_path(os.getppid()), 'w') as file:
+            json.dump(other.snapshot(), file)
+        body = metrics.render_metrics()
+        self.assertIn('yatube_request_duration_seconds_count{view="x"} 2',
+                      body)
+        self.assertIn('yatube_request_duration_seconds_sum{view="x"} 0.5',
+                      body)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="x",le="0.25"} 1',
+            body)
+
+    def test_dead_worker_snapshot_removed(self):
+        """Снимок завершившегося процесса удаляется и не учитывается."""
+        os.makedirs(TEMP_METRICS_DIR, exist_ok=True)
+        path = metrics.snapshot_path(2 ** 22 + 1)
+        other = metrics.Registry(settings.METRICS_BUCKETS)
+        other.observe(metrics.REQUEST_DURATION, 0.3, view='dead')
+        with open(path, 'w') as file:
+            json.dump(other.snapshot(), file)
+        self.assertNotIn('view="dead"', metrics.render_metrics())
+        self.assertFalse(os.path.exists(path))
+
+    def test_access_restricted(self):
+        """/metrics доступен персоналу сайта или с токеном, но не по
+        адресу localhost: за прокси он у всех запросов."""
+        response = self.client.get(reverse('core:metrics'),
+                                   REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        response = self.get_metrics('wrong')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.get_metrics().status_code, 200)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, 200)
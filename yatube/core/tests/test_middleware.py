@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post, User
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    def test_server_timing_header(self):
+        """Число SQL-запросов отдаётся в заголовке Server-Timing."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertRegex(response['Server-Timing'],
+                         r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0},
+                       QUERY_BUDGETS_COLD={'posts:index': 0})
+    def test_budget_exceeded_logged(self):
+        """Превышение бюджета запросов попадает в лог."""
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('posts:index', logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 100},
+                       QUERY_BUDGETS_COLD={'posts:index': 100})
+    def test_budget_respected(self):
+        """Запросы в пределах бюджета не логируются."""
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.middleware', 'WARNING'):
+                self.client.get(reverse('posts:index'))
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0},
+                       QUERY_BUDGETS_COLD={'posts:index': 100})
+    def test_cold_budget(self):
+        """Запрос, заполняющий кэш, сверяется с бюджетом холодного пути."""
+        cache.clear()
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.middleware', 'WARNING'):
+                self.client.get(reverse('posts:index'))
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('тёплый', logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={'posts:profile_export': 0},
+                       QUERY_BUDGETS_COLD={'posts:profile_export': 0})
+    def test_streaming_queries_counted(self):
+        """Запросы при отдаче потокового ответа входят в бюджет."""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост', author=author)
+        response = self.client.get(
+            reverse('posts:profile_export', args=(author.username,)))
+        self.assertIn('before streaming', response['Server-Timing'])
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            b''.join(response.streaming_content)
+        self.assertIn('posts:profile_export', logs.output[0])
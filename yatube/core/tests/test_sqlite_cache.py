@@ -0,0 +1,99 @@
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from ..sqlite_cache import SQLiteCache
+
+THREADS = 4
+INCREMENTS = 50
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values_shared_between_instances(self):
+        """Записи одного экземпляра видны другому — как другому процессу."""
+        self.cache.set('number', 1)
+        self.cache.set_many({'text': 'текст', 'list': [1, 2]})
+        other = self.make_cache()
+        self.assertEqual(other.get('number'), 1)
+        self.assertEqual(other.get_many(['text', 'list', 'missing']),
+                         {'text': 'текст', 'list': [1, 2]})
+        other.delete_many(['text', 'list'])
+        self.assertIsNone(self.cache.get('text'))
+
+    def test_timeouts(self):
+        """Просроченная запись не читается, add занимает её место."""
+        self.cache.set('expired', 'value', timeout=0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertFalse(self.cache.has_key('expired'))
+        self.assertTrue(self.cache.add('expired', 'new'))
+        self.assertFalse(self.cache.add('expired', 'other'))
+        self.assertEqual(self.cache.get('expired'), 'new')
+        self.cache.set('forever', 'value', timeout=None)
+        self.assertFalse(self.cache.add('forever', 'other'))
+        self.assertTrue(self.cache.touch('forever', 0))
+        self.assertIsNone(self.cache.get('forever'))
+
+    def test_incr_is_atomic(self):
+        """Параллельные incr из разных соединений не теряют приращений."""
+        self.cache.set('counter', 0)
+
+        def work():
+            cache = self.make_cache()
+            for _ in range(INCREMENTS):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=work) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), THREADS * INCREMENTS)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=2,
+                                ACCESS_RESOLUTION=0)
+        for key in 'abc':
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('d', 'd')
+        cache.set('e', 'e')
+        self.assertIn('a', cache.get_many('abcde'))
+        self.assertNotIn('b', cache.get_many('abcde'))
+
+    def test_private_directory(self):
+        """Каталог кэша создаётся закрытым, чужой каталог не открывается."""
+        path = os.path.join(self.directory, 'private', 'cache.sqlite3')
+        SQLiteCache(path, {}).set('key', 'value')
+        mode = os.stat(os.path.dirname(path)).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o700)
+        other = os.path.join(self.directory, 'other', 'cache.sqlite3')
+        with mock.patch('core.files.os.getuid', return_value=-1), \
+                self.assertRaises(ImproperlyConfigured):
+            SQLiteCache(other, {}).get('key')
+
+    def test_tests_use_own_cache(self):
+        """Тесты не работают с кэшем и метриками проекта."""
+        base = os.path.join(settings.BASE_DIR, '')
+        self.assertFalse(caches['default'].path.startswith(base))
+        self.assertFalse(settings.METRICS_DIR.startswith(base))
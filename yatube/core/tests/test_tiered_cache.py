@@ -0,0 +1,112 @@
+import time
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+
+from ..tiered_cache import L1, L2, TieredCache
+
+HOT_THRESHOLD = 2
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.backend = LocMemCache('tiered-test', {})
+        self.backend.clear()
+        self.cache = TieredCache(self.backend, 'test', size=2,
+                                 hot_threshold=HOT_THRESHOLD, hot_window=60,
+                                 l1_timeout=60)
+
+    def l2_reads(self, key, tag, times):
+        with mock.patch.object(self.backend, 'get_many',
+                               wraps=self.backend.get_many) as get_many:
+            for _ in range(times):
+                self.assertEqual(self.cache.get(key, tag), 'value')
+        return get_many.call_count
+
+    def test_hot_key_promoted(self):
+        """Горячий ключ после HOT_THRESHOLD чтений читается из L1."""
+        self.cache.set('hot', 'value', tag=1)
+        self.assertEqual(self.l2_reads('hot', 1, HOT_THRESHOLD),
+                         HOT_THRESHOLD)
+        self.assertEqual(self.l2_reads('hot', 1, 5), 0)
+        ratios = self.cache.hit_ratios()
+        self.assertEqual(ratios[L2], 1)
+        self.assertAlmostEqual(ratios[L1], 5 / (5 + HOT_THRESHOLD))
+
+    def test_version_move_drops_entry(self):
+        """С новой меткой запись L1 удаляется, устаревшая в L2 — промах."""
+        self.cache.set('hot', 'value', tag=1)
+        self.l2_reads('hot', 1, HOT_THRESHOLD)
+        self.assertIsNone(self.cache.get('hot', 2))
+        self.assertNotIn('hot', self.cache.l1)
+        self.cache.set('hot', 'new', tag=2)
+        self.assertEqual(self.cache.get('hot', 2), 'new')
+
+    def test_l1_is_bounded(self):
+        """L1 не держит больше size ключей."""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, 'value', tag=1)
+            self.l2_reads(key, 1, HOT_THRESHOLD)
+        self.assertEqual(list(self.cache.l1), ['b', 'c'])
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.backend = LocMemCache('single-flight-test', {})
+        self.backend.clear()
+        self.cache = TieredCache(self.backend, 'test', size=10,
+                                 hot_threshold=HOT_THRESHOLD, hot_window=60,
+                                 l1_timeout=60)
+        self.compute = mock.Mock(return_value='new')
+
+    def lock(self, key):
+        self.backend.add(f'single-flight:test:{key}', True)
+
+    def test_stale_served_while_other_recomputes(self):
+        """Пока другой пересчитывает, вызывающий получает прежнее значение."""
+        self.cache.get_or_set('page', 1, lambda: 'old', 60)
+        self.lock('page')
+        self.assertEqual(self.cache.get_or_set('page', 2, self.compute, 60),
+                         'old')
+        self.compute.assert_not_called()
+
+    def test_recompute_once(self):
+        """Взявший блокировку пересчитывает и снимает её."""
+        self.cache.get_or_set('page', 1, lambda: 'old', 60)
+        self.assertEqual(self.cache.get_or_set('page', 2, self.compute, 60),
+                         'new')
+        self.assertEqual(self.cache.get_or_set('page', 2, self.compute, 60),
+                         'new')
+        self.compute.assert_called_once()
+        self.assertIsNone(self.backend.get('single-flight:test:page'))
+
+    def test_stale_on_error(self):
+        """Ошибка пересчёта отдаёт устаревшее значение, а без него
+        пробрасывается."""
+        self.cache.get_or_set('page', 1, lambda: 'old', 60)
+        self.compute.side_effect = RuntimeError
+        with self.assertLogs('core.tiered_cache', 'ERROR'):
+            self.assertEqual(
+                self.cache.get_or_set('page', 2, self.compute, 60), 'old')
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_set('other', 1, self.compute, 60)
+
+    @override_settings(XFETCH_BETA=1.0)
+    def test_early_refresh(self):
+        """Дорогое значение обновляется заранее, до истечения срока."""
+        self.cache.store({'page': (1, 'old', time.time() + 10, 100.0, ())}, 60)
+        with mock.patch('core.tiered_cache.random.random', return_value=0.5):
+            self.assertEqual(
+                self.cache.get_or_set('page', 1, self.compute, 60), 'new')
+        self.cache.store({'page': (1, 'old', time.time() + 10, 0.001, ())}, 60)
+        self.assertEqual(self.cache.get_or_set('page', 1, self.compute, 60),
+                         'old')
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.1)
+    def test_missing_value_waits_then_computes(self):
+        """Без прежнего значения вызывающий ждёт чужой результат,
+        а не дождавшись — считает сам."""
+        self.lock('page')
+        self.assertEqual(self.cache.get_or_set('page', 1, self.compute, 60),
+                         'new')
@@ -0,0 +1,243 @@
+"""Двухуровневый кэш: небольшой L1 в памяти процесса перед общим L2.
+
+В L1 попадают только горячие ключи — те, что за окно HOT_WINDOW
+секунд прочитаны из L2 не меньше HOT_THRESHOLD раз. Остальные
+читаются из L2 как обычно, и память процесса на них не тратится.
+
+Каждое значение хранится с меткой версии (например, версиями поста,
+автора и группы). Читающий передаёт текущую метку: запись с другой
+меткой считается устаревшей и в L1 сразу удаляется, а в L2
+перезаписывается новым рендером. Поэтому сдвиг версии в L2 виден
+всем процессам, хотя L1 у каждого свой.
+
+get_or_set() защищает от лавины пересчётов: после истечения или
+сдвига версии значение пересчитывает один вызывающий, остальные
+получают прежнее.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+L1 = 'l1'
+L2 = 'l2'
+
+SINGLE_FLIGHT_POLL = 0.05
+
+# Запись: (метка, значение, срок обновления, время пересчёта, области).
+# Записи другого вида (от прежних версий кода) считаются промахом.
+ENTRY_SIZE = 5
+
+
+class TieredCache:
+    def __init__(self, backend, name, size, hot_threshold, hot_window,
+                 l1_timeout):
+        self.backend = backend
+        self.name = name
+        self.size = size
+        self.hot_threshold = hot_threshold
+        self.hot_window = hot_window
+        self.l1_timeout = l1_timeout
+        self.lock = threading.Lock()
+        self.l1 = OrderedDict()
+        self.reads = defaultdict(int)
+        self.window_started = time.monotonic()
+        self.stats = {(tier, result): 0 for tier in (L1, L2)
+                      for result in ('hit', 'miss')}
+
+    def count(self, tier, hits, misses):
+        if tier == L2 and misses:
+            metrics.mark_cold()
+        for result, value in (('hit', hits), ('miss', misses)):
+            if not value:
+                continue
+            self.stats[tier, result] += value
+            metrics.inc(metrics.CACHE_TIER_REQUESTS, value, cache=self.name,
+                        tier=tier, result=result)
+
+    def hit_ratios(self):
+        """Доля попаданий по уровням с момента запуска процесса."""
+        with self.lock:
+            stats = dict(self.stats)
+        ratios = {}
+        for tier in (L1, L2):
+            total = stats[tier, 'hit'] + stats[tier, 'miss']
+            ratios[tier] = stats[tier, 'hit'] / total if total else None
+        return ratios
+
+    def is_hot(self, key):
+        # Счётчики чтений из L2 в фиксированном окне; словарь счётчиков
+        # обнуляется вместе с окном и не растёт без предела.
+        now = time.monotonic()
+        if (now - self.window_started > self.hot_window
+                or len(self.reads) > self.size * 10):
+            self.reads.clear()
+            self.window_started = now
+        self.reads[key] += 1
+        return self.reads[key] >= self.hot_threshold
+
+    def promote(self, key, entry):
+        self.l1[key] = (entry, time.monotonic() + self.l1_timeout)
+        self.l1.move_to_end(key)
+        while len(self.l1) > self.size:
+            self.l1.popitem(last=False)
+
+    def evict(self, scopes):
+        """Удаляет из L1 записи, зависящие от областей scopes —
+        например, по событиям шины инвалидации."""
+        scopes = set(scopes)
+        with self.lock:
+            for key in [key for key, (entry, _) in self.l1.items()
+                        if scopes.intersection(entry[4])]:
+                del self.l1[key]
+
+    def entries(self, tags):
+        """Записи (метка, значение, срок обновления, цена, области)
+        для ключей tags = {ключ: текущая метка} — из L1, остальные из L2.
+        Записи с чужой меткой тоже возвращаются: это устаревшие
+        значения."""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self.lock:
+            for key, tag in tags.items():
+                cached = self.l1.get(key)
+                if cached is not None and cached[0][0] == tag \
+                        and cached[1] > now:
+                    self.l1.move_to_end(key)
+                    found[key] = cached[0]
+                else:
+                    self.l1.pop(key, None)
+                    missing.append(key)
+        self.count(L1, len(found), len(missing))
+        if not missing:
+            return found
+        stored = self.backend.get_many(missing)
+        hits = 0
+        with self.lock:
+            for key in missing:
+                entry = stored.get(key)
+                if entry is None or len(entry) != ENTRY_SIZE:
+                    continue
+                found[key] = entry
+                if entry[0] != tags[key]:
+                    continue
+                hits += 1
+                if self.is_hot(key):
+                    self.promote(key, entry)
+        self.count(L2, hits, len(missing) - hits)
+        return found
+
+    def get_many(self, tags):
+        """{ключ: значение} для ключей tags = {ключ: текущая метка}."""
+        return {key: entry[1] for key, entry in self.entries(tags).items()
+                if entry[0] == tags[key]}
+
+    def get(self, key, tag, default=None):
+        return self.get_many({key: tag}).get(key, default)
+
+    def store(self, entries, timeout):
+        """Пишет записи в L2; горячие ключи — сразу и в L1.
+
+        Для записей со сроком обновления L2 держит их ещё
+        STALE_CACHE_TIMEOUT секунд: устаревшее значение отдаётся,
+        пока новое пересчитывается или если пересчёт упал.
+        """
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None and any(
+                entry[2] is not None for entry in entries.values()):
+            timeout += settings.STALE_CACHE_TIMEOUT
+        self.backend.set_many(entries, timeout)
+        with self.lock:
+            for key, entry in entries.items():
+                if key in self.l1 or self.reads.get(key, 0) >= \
+                        self.hot_threshold:
+                    self.promote(key, entry)
+
+    def set_many(self, data, tags, timeout=DEFAULT_TIMEOUT, scopes=None):
+        """scopes = {ключ: области}, по которым запись можно вытеснить
+        из L1 через evict()."""
+        scopes = scopes or {}
+        self.store({key: (tags[key], value, None, None,
+                          tuple(scopes.get(key, ())))
+                    for key, value in data.items()}, timeout)
+
+    def set(self, key, value, tag, timeout=DEFAULT_TIMEOUT, scopes=()):
+        self.set_many({key: value}, {key: tag}, timeout, {key: scopes})
+
+    def needs_refresh(self, entry, tag):
+        """Устарела ли запись — или пора обновить её заранее.
+
+        Ранее обновление по XFetch: чем ближе срок и чем дольше
+        считалось значение, тем вероятнее, что очередной читатель
+        пересчитает его до истечения, и истечение не застанет разом
+        всех читателей.
+        """
+        value_tag, _, refresh_at, cost, _ = entry
+        if value_tag != tag:
+            return True
+        if refresh_at is None:
+            return False
+        return time.time() - cost * settings.XFETCH_BETA * math.log(
+            random.random() or 1e-12) >= refresh_at
+
+    def wait_for(self, key, tag):
+        # Значения нет совсем: ждём, пока его посчитает владелец
+        # блокировки, но не дольше SINGLE_FLIGHT_WAIT.
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(SINGLE_FLIGHT_POLL)
+            entry = self.backend.get(key)
+            if entry is not None and entry[0] == tag:
+                return entry
+        return None
+
+    def get_or_set(self, key, tag, compute, timeout, scopes=()):
+        """Значение с меткой tag; при промахе его считает compute().
+
+        Пересчитывает один вызывающий на все процессы — тот, кто взял
+        блокировку в L2. Остальные тем временем получают устаревшее
+        значение, а если его нет — ждут результат. Если compute() упал,
+        отдаётся устаревшее значение, когда оно есть.
+        """
+        entry = self.entries({key: tag}).get(key)
+        if entry is not None and not self.needs_refresh(entry, tag):
+            return entry[1]
+        lock = f'single-flight:{self.name}:{key}'
+        locked = self.backend.add(lock, True,
+                                  settings.SINGLE_FLIGHT_LOCK_TIMEOUT)
+        if not locked:
+            if entry is not None:
+                return entry[1]
+            entry = self.wait_for(key, tag)
+            if entry is not None:
+                return entry[1]
+        try:
+            start = time.monotonic()
+            value = compute()
+            cost = time.monotonic() - start
+        except Exception:
+            if entry is None:
+                raise
+            logger.exception('Пересчёт %s упал, отдаём устаревшее значение',
+                             key)
+            return entry[1]
+        finally:
+            if locked:
+                self.backend.delete(lock)
+        self.store({key: (tag, value, time.time() + timeout, cost,
+                          tuple(scopes))}, timeout)
+        return value
+
+    def clear_local(self):
+        with self.lock:
+            self.l1.clear()
+            self.reads.clear()
@@ -1 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
 handler404 = 'core.views.page_not_found'
+
+urlpatterns = [
+    path('metrics', views.metrics, name='metrics'),
+]
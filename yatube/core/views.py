@@ -1,4 +1,9 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics as core_metrics
 
 
 def page_not_found(request, exception):
@@ -11,3 +16,25 @@ def csrf_failure(request, reason=''):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html')
+
+
+def metrics_allowed(request):
+    """Персонал сайта, запрос с токеном METRICS_TOKEN или адрес из
+    METRICS_ALLOWED_IPS (по умолчанию пуст: за обратным прокси
+    REMOTE_ADDR у всех запросов — адрес прокси)."""
+    if request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        core_metrics.render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,34 +1,80 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db.models.functions import Substr
 
+from . import search
 from .models import Comment, Follow, Group, Post
+from .utils import CappedPaginator
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*) и без полного текста записей.
+
+    Столбец 'text' в list_display показывается как начало текста,
+    отрезанное в SQL: сам текст откладывается (defer) и в список
+    не читается.
+    """
+    paginator = CappedPaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('text').annotate(
+            text_preview=Substr('text', 1, settings.ADMIN_TEXT_PREVIEW))
+
+    def get_list_display(self, request):
+        return tuple('text_preview' if name == 'text' else name
+                     for name in super().get_list_display(request))
+
+    def text_preview(self, obj):
+        if len(obj.text_preview) < settings.ADMIN_TEXT_PREVIEW:
+            return obj.text_preview
+        return f'{obj.text_preview}…'
+    text_preview.short_description = 'Текст'
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
-    list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
-    empty_value_display = '-пусто-'
+    ordering = ('-pub_date', '-id')
+
+    def get_search_results(self, request, queryset, search_term):
+        match = search.match_query(search_term)
+        if match is None or not search.search_available():
+            return super().get_search_results(request, queryset, search_term)
+        return search.filter_matching(queryset, match), False
 
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
+    search_fields = ('title', 'slug')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ('post', 'author', 'text', 'created')
-    list_editable = ('text',)
+class CommentAdmin(ScalableAdmin):
+    list_display = ('post_link', 'author', 'text', 'created')
+    list_select_related = ('author',)
+    autocomplete_fields = ('post', 'author')
     search_fields = ('text',)
     list_filter = ('created',)
-    empty_value_display = '-пусто-'
+    ordering = ('-created', '-id')
+
+    def post_link(self, obj):
+        return f'#{obj.post_id}' if obj.post_id else None
+    post_link.short_description = 'Пост'
 
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
-    list_filter = ('user',)
-    search_fields = ('author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    paginator = CappedPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+
+from . import cache, counters, invalidation
+from .models import Comment, FeedCounter, Post, UserStats
+from .stats import recount_stats
+from .timeline import rebuild_timelines
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_create(model, objects, batch_size, **kwargs):
+    """bulk_create порциями: генератор объектов не держится в памяти
+    целиком."""
+    for batch in chunked(objects, batch_size):
+        model.objects.bulk_create(batch, **kwargs)
+
+
+@contextmanager
+def explicit_dates(model, *field_names):
+    """auto_now_add перезаписывает даты и при bulk_create; на время
+    массовой загрузки сохраняем даты, заданные явно."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def recount_comments(post_ids):
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(total=Count('pk')).values('total')
+    Post.objects.filter(pk__in=post_ids, comments__isnull=False).update(
+        comments_count=Subquery(comments))
+
+
+def refresh_derived_data(user_ids=(), author_ids=(), post_ids=(),
+                         since_post_id=None, chunk_size=1000):
+    """Пересчитывает то, что обычно поддерживают сигналы, после
+    bulk_create, который сигналов не посылает.
+
+    user_ids — пользователи, у которых изменились посты или подписки;
+    author_ids — авторы, чьи посты нужно разложить по лентам
+    подписчиков, а since_post_id — с какого id начинаются новые посты;
+    post_ids — посты с новыми комментариями. Версии кэша сдвигаются
+    после фиксации транзакции, иначе в кэш успеют попасть старые данные.
+
+    Версии сдвигаются грубо — лент и затронутых авторов, а не каждого
+    поста: версия автора входит в метку всех его карточек. События шины
+    инвалидации пишутся порциями по chunk_size имён.
+    """
+    names = {cache.FEED_VERSION}
+    for chunk in chunked(post_ids, chunk_size):
+        recount_comments(chunk)
+        names.update(
+            f'user:{author_id}' for author_id in Post.objects.filter(
+                pk__in=chunk).order_by().values_list(
+                    'author_id', flat=True).distinct())
+    for chunk in chunked(user_ids, chunk_size):
+        recount_stats(chunk)
+        for user_id in chunk:
+            names.update((f'user:{user_id}', f'follows:{user_id}'))
+    # Статистика уже пересчитана: по ней решается, раскладывать ли
+    # посты автора по лентам.
+    rebuild_timelines(author_ids, since_post_id)
+    FeedCounter.objects.all().delete()
+    publish_changes(names, since_post_id, chunk_size)
+
+
+def apply_deltas(model, field, deltas, key='pk', chunk_size=1000):
+    """Сдвигает field существующих строк на {id: дельта}: по UPDATE
+    на каждое значение дельты."""
+    ids_by_delta = defaultdict(list)
+    for object_id, delta in deltas.items():
+        ids_by_delta[delta].append(object_id)
+    for delta, ids in ids_by_delta.items():
+        for chunk in chunked(ids, chunk_size):
+            model.objects.filter(**{f'{key}__in': chunk}).update(
+                **{field: F(field) + delta})
+
+
+def apply_batch_deltas(posts, comments, since_post_id, post_ids=(),
+                       chunk_size=1000):
+    """Обновляет производные данные после одной порции bulk_create.
+
+    В отличие от refresh_derived_data() ничего не пересчитывает заново:
+    счётчики сдвигаются на дельты порции, а по лентам раскладываются
+    только её посты — с id больше since_post_id или из post_ids. Работа
+    не растёт с объёмом уже загруженных данных, а вызов в транзакции
+    порции оставляет данные согласованными и после сбоя.
+    """
+    by_author = defaultdict(int)
+    by_group = defaultdict(int)
+    for post in posts:
+        by_author[post.author_id] += 1
+        if post.group_id:
+            by_group[post.group_id] += 1
+    by_post = defaultdict(int)
+    for comment in comments:
+        by_post[comment.post_id] += 1
+    apply_deltas(Post, 'comments_count', by_post, chunk_size=chunk_size)
+    authors = sorted(by_author)
+    counted = set()
+    for chunk in chunked(authors, chunk_size):
+        counted.update(UserStats.objects.filter(
+            user_id__in=chunk).values_list('user_id', flat=True))
+    apply_deltas(UserStats, 'posts_count',
+                 {author_id: by_author[author_id] for author_id in counted},
+                 key='user_id', chunk_size=chunk_size)
+    # Статистику без записи считаем целиком, уже с постами порции: по ней
+    # решается, раскладывать ли посты автора по лентам.
+    for chunk in chunked([author_id for author_id in authors
+                          if author_id not in counted], chunk_size):
+        recount_stats(chunk)
+    rebuild_timelines(authors, since_post_id, list(post_ids))
+    counters.change_counters([counters.ALL], len(posts))
+    for author_id, delta in by_author.items():
+        counters.change_counters([counters.author_scope(author_id)], delta)
+        counters.change_follower_counters(author_id, delta)
+    for group_id, delta in by_group.items():
+        counters.change_counters([counters.group_scope(group_id)], delta)
+    names = {cache.FEED_VERSION}
+    names.update(f'user:{author_id}' for author_id in authors)
+    for chunk in chunked(sorted(by_post), chunk_size):
+        names.update(
+            f'user:{author_id}' for author_id in Post.objects.filter(
+                pk__in=chunk).order_by().values_list(
+                    'author_id', flat=True).distinct())
+    publish_changes(names, since_post_id, chunk_size)
+
+
+def publish_changes(names, since_post_id, chunk_size):
+    """Публикует события шины инвалидации порциями по chunk_size имён
+    и сдвигает версии кэша после фиксации транзакции."""
+    names = sorted(names)
+    for chunk in chunked(names, chunk_size):
+        invalidation.publish('bulk', since_post_id or '', chunk)
+    transaction.on_commit(lambda: bump_versions(names))
+
+
+def bump_versions(names):
+    for name in names:
+        cache.bump_version(name)
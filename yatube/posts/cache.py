@@ -0,0 +1,169 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import metrics
+from core.tiered_cache import TieredCache
+
+from . import invalidation
+
+FEED_VERSION = 'feed'
+
+fragments = TieredCache(
+    cache, 'fragment', settings.L1_CACHE_SIZE,
+    settings.L1_HOT_THRESHOLD, settings.L1_HOT_WINDOW,
+    settings.L1_CACHE_TIMEOUT)
+
+cards_cache = TieredCache(
+    cache, 'card', settings.L1_CACHE_SIZE,
+    settings.L1_HOT_THRESHOLD, settings.L1_HOT_WINDOW,
+    settings.L1_CACHE_TIMEOUT)
+
+
+def version_key(name):
+    return f'version:{name}'
+
+
+def changed_key(name):
+    return f'changed:{name}'
+
+
+def new_version():
+    # Версия, заведённая заново после вытеснения, не должна совпасть
+    # со старой, поэтому начинаем с текущего времени, а не с единицы.
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    key = version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(names):
+    """Версии сразу для нескольких имён: один get_many."""
+    keys = {version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def bump_version(name):
+    key = version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, new_version(), None)
+    cache.set(changed_key(name), time.time(), None)
+
+
+def get_changed(names):
+    """Время последнего изменения по каждому имени версии. Если оно
+    неизвестно (например, вытеснено из кэша), считаем, что изменение
+    произошло сейчас."""
+    keys = {changed_key(name): name for name in names}
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time(), None)
+            found[key] = cache.get(key)
+    return {keys[key]: datetime.fromtimestamp(value, timezone.utc)
+            for key, value in found.items()}
+
+
+def page_key(request):
+    return request.GET.get('cursor') or request.GET.get('page') or '1'
+
+
+def fragment_key(scope, request, vary_on=()):
+    """Ключ фрагмента ленты: область, страница или курсор и вход
+    пользователя. Версия лент — метка значения в get_or_render()."""
+    parts = (
+        page_key(request),
+        str(request.user.is_authenticated),
+        *(str(value) for value in vary_on),
+    )
+    digest = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    return f'fragment:{scope}:{digest}'
+
+
+def get_or_render(key, render):
+    rendered = []
+
+    def compute():
+        rendered.append(True)
+        return render()
+
+    content = fragments.get_or_set(key, get_version(FEED_VERSION), compute,
+                                   settings.FRAGMENT_CACHE_TIMEOUT,
+                                   scopes=(FEED_VERSION,))
+    metrics.cache_result('fragment', not rendered)
+    return content
+
+
+def post_version_names(post):
+    names = [f'post:{post.pk}', f'user:{post.author_id}']
+    if post.group_id:
+        names.append(f'group:{post.group_id}')
+    return names
+
+
+def render_cards(posts, template_name, extra=None, prepare=None):
+    """Карточки постов страницы: версии и готовый HTML читаются двумя
+    get_many, рендерятся только отсутствующие в кэше карточки.
+
+    Метка карточки — версии поста, его автора и группы, поэтому
+    их изменение сразу делает старую карточку недоступной. prepare
+    получает список постов, карточки которых будут рендериться.
+    """
+    posts = list(posts)
+    extra = extra or {}
+    variant = hashlib.md5(
+        f'{template_name}:{sorted(extra.items())}'.encode()).hexdigest()
+    versions = get_versions(
+        {name for post in posts for name in post_version_names(post)})
+    keys = [f'card:{variant}:{post.pk}' for post in posts]
+    tags = {
+        key: tuple(versions[name] for name in post_version_names(post))
+        for key, post in zip(keys, posts)
+    }
+    cards = cards_cache.get_many(tags)
+    metrics.inc(metrics.CACHE_REQUESTS, len(cards), cache='card',
+                result='hit')
+    metrics.inc(metrics.CACHE_REQUESTS, len(keys) - len(cards),
+                cache='card', result='miss')
+    missed = [(key, post) for key, post in zip(keys, posts)
+              if key not in cards]
+    if missed and prepare is not None:
+        prepare([post for _, post in missed])
+    rendered = {
+        key: render_to_string(template_name, {'post': post, **extra})
+        for key, post in missed
+    }
+    if rendered:
+        cards_cache.set_many(
+            rendered, tags, settings.CARD_CACHE_TIMEOUT,
+            scopes={key: post_version_names(post) for key, post in missed})
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
+
+
+@invalidation.subscribe
+def evict_local(events):
+    """Убирает из L1 этого процесса фрагменты и карточки, затронутые
+    изменениями в других процессах."""
+    scopes = {scope for event in events for scope in event.scopes}
+    fragments.evict(scopes)
+    cards_cache.evict(scopes)
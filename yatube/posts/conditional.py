@@ -0,0 +1,105 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import cache, counters, identity
+from .models import Comment, Post
+
+
+def feed_validators(queryset, scope):
+    latest = queryset.order_by('-pub_date').values_list(
+        'pub_date', flat=True).first()
+    count, _ = counters.get_count(scope, queryset)
+    return [latest, count], [latest], [cache.FEED_VERSION]
+
+
+def index_validators(request):
+    return feed_validators(Post.objects.all(), counters.ALL)
+
+
+def group_validators(request, slug):
+    group_id = identity.get_group(slug).id
+    return feed_validators(Post.objects.filter(group_id=group_id),
+                           counters.group_scope(group_id))
+
+
+def profile_validators(request, username):
+    author_id = identity.get_user(username).id
+    parts, timestamps, names = feed_validators(
+        Post.objects.filter(author_id=author_id),
+        counters.author_scope(author_id))
+    return parts, timestamps, [*names, f'follows:{author_id}']
+
+
+def post_validators(request, post_id):
+    post = Post.objects.filter(pk=post_id).values(
+        'pub_date', 'author_id', 'group_id', 'comments_count').first()
+    if post is None:
+        raise Http404
+    latest_comment = Comment.objects.filter(post_id=post_id).order_by(
+        '-created').values_list('created', flat=True).first()
+    author_posts, _ = counters.get_count(
+        counters.author_scope(post['author_id']),
+        Post.objects.filter(author_id=post['author_id']))
+    names = [f'post:{post_id}', f'user:{post["author_id"]}',
+             f'comments:{post_id}']
+    if post['group_id']:
+        names.append(f'group:{post["group_id"]}')
+    return (
+        [post['pub_date'], latest_comment, post['comments_count'],
+         author_posts],
+        [post['pub_date'], latest_comment],
+        names,
+    )
+
+
+def conditional_page(validators):
+    """Отвечает 304 Not Modified, если страница не изменилась.
+
+    validators(request, *args, **kwargs) возвращает значения для ETag,
+    отметки времени для Last-Modified и имена версий кэша, которые
+    меняются при редактировании. Всё это дешевле рендеринга страницы.
+    Страницы для анонимных пользователей разрешено хранить общим кэшам
+    и отдавать устаревшими, пока кэш их обновляет или сайт недоступен.
+    """
+    def get_validators(request, *args, **kwargs):
+        if not hasattr(request, '_page_validators'):
+            parts, timestamps, names = validators(request, *args, **kwargs)
+            versions = cache.get_versions(names)
+            changed = cache.get_changed(names)
+            parts = [*parts, *(versions[name] for name in names),
+                     request.user.pk, request.get_full_path()]
+            etag = hashlib.md5(repr(parts).encode()).hexdigest()
+            last_modified = max(
+                [*filter(None, timestamps), *changed.values()])
+            request._page_validators = etag, last_modified
+        return request._page_validators
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=lambda *args, **kwargs: get_validators(
+                *args, **kwargs)[0],
+            last_modified_func=lambda *args, **kwargs: get_validators(
+                *args, **kwargs)[1],
+        )(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response, public=True, max_age=0,
+                    s_maxage=settings.PAGE_SHARED_CACHE_MAX_AGE,
+                    stale_while_revalidate=(
+                        settings.PAGE_STALE_WHILE_REVALIDATE),
+                    stale_if_error=settings.PAGE_STALE_IF_ERROR)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat
+
+from core import metrics
+
+from .models import FeedCounter, Follow
+
+ALL = 'all'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def post_scopes(author_id, group_id):
+    """Ленты, в которые попадает пост с такими автором и группой,
+    кроме лент подписчиков — их сдвигает change_follower_counters()."""
+    scopes = [ALL, author_scope(author_id)]
+    if group_id:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def change_counters(scopes, delta):
+    """Сдвигает уже существующие счётчики; отсутствующие посчитаются
+    при первом чтении."""
+    if scopes and delta:
+        FeedCounter.objects.filter(scope__in=scopes).update(
+            value=F('value') + delta)
+
+
+def change_follower_counters(author_id, delta):
+    """Сдвигает счётчики лент подписок всех подписчиков автора одним
+    UPDATE с подзапросом: список подписчиков в процесс не читается."""
+    if not delta:
+        return
+    scopes = Follow.objects.filter(author_id=author_id).annotate(
+        scope=Concat(Value('follow:'), Cast('user_id', CharField()),
+                     output_field=CharField()),
+    ).values('scope')
+    FeedCounter.objects.filter(scope__in=scopes).update(
+        value=F('value') + delta)
+
+
+def reset_counters(scopes):
+    FeedCounter.objects.filter(scope__in=scopes).delete()
+
+
+def reset_follow_counters():
+    """Сбрасывает счётчики всех лент подписок: они пересчитаются при
+    первом чтении."""
+    FeedCounter.objects.filter(scope__startswith=follow_scope('')).delete()
+
+
+def estimate_key(scope):
+    return f'counters:estimate:{scope}'
+
+
+def seed_counter(scope, queryset, cap=None):
+    """Считает ленту и сохраняет счётчик в одной транзакции.
+
+    Строка счётчика пишется до подсчёта: сохранение поста, начатое
+    параллельно, ждёт блокировку записи и сдвигает уже готовый счётчик,
+    а не теряется между подсчётом и созданием строки. Лента длиннее cap
+    не сохраняется — тогда возвращается None.
+    """
+    with transaction.atomic():
+        FeedCounter.objects.filter(scope=scope).delete()
+        FeedCounter.objects.create(scope=scope, value=settings.ZERO)
+        rows = queryset.order_by()
+        value = (rows if cap is None else rows[:cap + 1]).count()
+        if cap is not None and value > cap:
+            transaction.set_rollback(True)
+            return None
+        FeedCounter.objects.filter(scope=scope).update(value=value)
+    cache.delete(estimate_key(scope))
+    return value
+
+
+def get_count(scope, queryset):
+    """Количество постов ленты и признак того, что оно точное.
+
+    Если счётчика ещё нет, считаем не дальше FEED_COUNT_CAP строк:
+    точный результат сохраняем как счётчик, иначе отдаём потолок
+    и запоминаем это на FEED_COUNT_ESTIMATE_TIMEOUT секунд, чтобы
+    не повторять подсчёт на каждом запросе. Точные счётчики больших лент
+    заводит команда recount_feed_counters.
+    """
+    value = FeedCounter.objects.filter(scope=scope).values_list(
+        'value', flat=True).first()
+    if value is not None:
+        return max(value, settings.ZERO), True
+    cap = settings.FEED_COUNT_CAP
+    if cache.get(estimate_key(scope)):
+        return cap, False
+    metrics.mark_cold()
+    value = seed_counter(scope, queryset, cap)
+    if value is None:
+        cache.set(estimate_key(scope), True,
+                  settings.FEED_COUNT_ESTIMATE_TIMEOUT)
+        return cap, False
+    return value, True
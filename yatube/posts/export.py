@@ -0,0 +1,120 @@
+import csv
+import json
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+
+from .utils import NEXT, CursorPaginator, decode_cursor, encode_cursor
+
+FIELDS = ('id', 'pub_date', 'author__username', 'group__slug', 'text',
+          'comments_count', 'image')
+HEADER = ('id', 'pub_date', 'author', 'group', 'text', 'comments_count',
+          'image')
+
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+CURSOR_PREFIX = '# next_cursor='
+
+
+class PostExport:
+    """Посты ленты порциями по EXPORT_CHUNK_SIZE по ключам (keyset).
+
+    Каждая порция — отдельный короткий запрос по индексу, поэтому
+    соединение не держит открытый курсор всё время выгрузки. Когда
+    истекает EXPORT_TIME_BUDGET, выгрузка останавливается на границе
+    порции, а next_cursor позволяет продолжить её следующим запросом.
+    """
+
+    def __init__(self, queryset, cursor=None):
+        self.paginator = CursorPaginator(queryset, settings.EXPORT_CHUNK_SIZE)
+        self.values = None
+        if cursor:
+            _, _, self.values = decode_cursor(cursor)
+            if len(self.values) != len(self.paginator.keys):
+                raise ValueError('Некорректный курсор')
+        self.next_cursor = None
+
+    def rows(self):
+        chunk_size = self.paginator.per_page
+        deadline = time.monotonic() + settings.EXPORT_TIME_BUDGET
+        values = self.values
+        while True:
+            queryset = self.paginator.object_list
+            if values is not None:
+                queryset = queryset.filter(
+                    self.paginator.keyset_filter(values, after=True))
+            count = 0
+            for row in queryset.values(*FIELDS)[:chunk_size].iterator(
+                    chunk_size=chunk_size):
+                count += 1
+                values = [row['pub_date'], row['id']]
+                yield row
+            if count < chunk_size:
+                return
+            if time.monotonic() >= deadline:
+                self.next_cursor = encode_cursor(
+                    NEXT, settings.NUMBER_ONE, values)
+                return
+
+
+def serialize(row):
+    return [
+        row['id'],
+        row['pub_date'].isoformat(),
+        row['author__username'],
+        row['group__slug'] or '',
+        row['text'],
+        row['comments_count'],
+        default_storage.url(row['image']) if row['image'] else '',
+    ]
+
+
+def jsonl_lines(export):
+    for row in export.rows():
+        yield json.dumps(dict(zip(HEADER, serialize(row))),
+                         ensure_ascii=False) + '\n'
+    if export.next_cursor:
+        yield json.dumps({'next_cursor': export.next_cursor}) + '\n'
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: отдаёт строку, а не пишет."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(export):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for row in export.rows():
+        yield writer.writerow(serialize(row))
+    if export.next_cursor:
+        yield f'{CURSOR_PREFIX}{export.next_cursor}\r\n'
+
+
+def export_response(request, queryset, filename):
+    """Потоковая выгрузка постов в JSONL (по умолчанию) или CSV.
+
+    Если выгрузка не уложилась в отведённое время, последней строкой
+    идёт курсор: {"next_cursor": ...} в JSONL или «# next_cursor=...»
+    в CSV. Его передают в ?cursor=, чтобы получить продолжение.
+    """
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    try:
+        export = PostExport(queryset, request.GET.get('cursor') or None)
+    except ValueError:
+        return HttpResponseBadRequest('Некорректный курсор')
+    lines = jsonl_lines if export_format == 'jsonl' else csv_lines
+    response = StreamingHttpResponse(
+        lines(export), content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{export_format}"')
+    return response
@@ -1,6 +1,7 @@
 from django import forms
 
-from .models import Comment, Post
+from . import identity
+from .models import Comment, Group, Post
 
 
 class PostForm(forms.ModelForm):
@@ -18,6 +19,12 @@ class PostForm(forms.ModelForm):
             'image': 'Загрузите картинку к посту',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Список групп — из кэша; queryset поля остаётся для проверки.
+        field = self.fields['group']
+        field.choices = [('', field.empty_label), *identity.group_choices()]
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -29,3 +36,15 @@ class CommentForm(forms.ModelForm):
         help_texts = {
             'text': 'Текст нового комментария',
         }
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Искать', max_length=200)
+    group = forms.ModelChoiceField(
+        queryset=Group.objects.all(),
+        to_field_name='slug',
+        required=False,
+        label='Группа',
+        empty_label='Все группы',
+    )
+    author = forms.CharField(label='Автор', max_length=150, required=False)
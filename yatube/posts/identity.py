@@ -0,0 +1,106 @@
+"""Кэш поиска групп по slug и пользователей по username.
+
+Эти поиски открывают ленту группы, профиль, подписку и выгрузки.
+Найденный объект хранится в общем кэше IDENTITY_CACHE_TIMEOUT секунд,
+отсутствие — IDENTITY_NEGATIVE_TIMEOUT секунд, поэтому и повторные
+запросы к несуществующим адресам не доходят до базы.
+
+В кэше лежат только публичные поля из IDENTITY_FIELDS — без хеша
+пароля, почты и флагов прав; объект собирается из них через from_db(),
+остальные поля догружаются из базы при обращении.
+
+Рядом с записью хранится обратная ссылка pk -> ключ: при сохранении
+или удалении объекта сигналы удаляют и запись по новому значению
+(там могло лежать отсутствие), и по прежнему — если slug или username
+поменялись.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from core import metrics
+
+from .models import Group, User
+
+# Отсутствие объекта; None кэш возвращает для отсутствующего ключа.
+NOT_FOUND = False
+
+GROUP_CHOICES_KEY = 'identity:group-choices'
+
+IDENTITY_FIELDS = {
+    Group: ('id', 'title', 'slug', 'description'),
+    User: ('id', 'username', 'first_name', 'last_name'),
+}
+
+
+def lookup_key(model, value):
+    digest = hashlib.md5(value.encode()).hexdigest()
+    return f'identity:{model._meta.model_name}:{digest}'
+
+
+def owner_key(model, pk):
+    return f'identity:{model._meta.model_name}:pk:{pk}'
+
+
+def get_cached(model, field, value):
+    """Объект model с field=value или None."""
+    key = lookup_key(model, value)
+    fields = IDENTITY_FIELDS[model]
+    values = cache.get(key)
+    if values is None:
+        metrics.mark_cold()
+        values = model.objects.filter(**{field: value}).values_list(
+            *fields).first()
+        if values is None:
+            cache.set(key, NOT_FOUND, settings.IDENTITY_NEGATIVE_TIMEOUT)
+            return None
+        cache.set_many({key: values, owner_key(model, values[0]): key},
+                       settings.IDENTITY_CACHE_TIMEOUT)
+    if not values:
+        return None
+    return model.from_db('default', fields, values)
+
+
+def get_or_404(model, field, value):
+    found = get_cached(model, field, value)
+    if found is None:
+        raise Http404
+    return found
+
+
+def get_group(slug):
+    return get_or_404(Group, 'slug', slug)
+
+
+def get_user(username):
+    return get_or_404(User, 'username', username)
+
+
+def forget(model, pk, value, *keys):
+    """Удаляет записи объекта по value и по прежнему значению,
+    а заодно ключи keys."""
+    keys = [lookup_key(model, value), owner_key(model, pk), *keys]
+    previous = cache.get(owner_key(model, pk))
+    if previous is not None:
+        keys.append(previous)
+    cache.delete_many(keys)
+
+
+def forget_group(group):
+    forget(Group, group.pk, group.slug, GROUP_CHOICES_KEY)
+
+
+def forget_user(user):
+    forget(User, user.pk, user.username)
+
+
+def group_choices():
+    """Варианты выбора группы для PostForm: [(pk, название)]."""
+    choices = cache.get(GROUP_CHOICES_KEY)
+    if choices is None:
+        choices = list(Group.objects.values_list('pk', 'title'))
+        cache.set(GROUP_CHOICES_KEY, choices,
+                  settings.IDENTITY_CACHE_TIMEOUT)
+    return choices
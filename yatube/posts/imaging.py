@@ -0,0 +1,113 @@
+"""Перекодирование загруженных картинок.
+
+Функции выполняются в отдельных процессах пула, поэтому модуль
+не импортирует Django: в дочернем процессе он не настроен.
+"""
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+EXTENSIONS = {
+    'AVIF': '.avif',
+    'WEBP': '.webp',
+    'JPEG': '.jpg',
+}
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+
+# Форматы без прозрачности: картинку с альфа-каналом кладём на белый фон.
+OPAQUE_FORMATS = {'JPEG'}
+
+
+def supported_formats(formats):
+    """Форматы, которые умеет сохранять эта сборка Pillow."""
+    Image.init()
+    return [image_format for image_format in formats
+            if image_format in Image.SAVE]
+
+
+def supported_format(formats):
+    """Первый из форматов, который умеет сохранять эта сборка Pillow."""
+    supported = supported_formats(formats)
+    return supported[0] if supported else None
+
+
+def flatten(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def prepare(image, image_format):
+    if image_format in OPAQUE_FORMATS:
+        return flatten(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA')
+    return image
+
+
+def encode_image(source_path, target_path, max_size, quality, formats):
+    """Уменьшает картинку до max_size по большей стороне, поворачивает
+    по EXIF и сохраняет в target_path без метаданных.
+
+    Возвращает формат результата или None, если картинку лучше оставить
+    как есть: анимацию не трогаем, а маленькую картинку без метаданных
+    сохраняем, только если перекодирование её уменьшило.
+    """
+    image_format = supported_format(formats)
+    if image_format is None:
+        return None
+    with Image.open(source_path) as image:
+        if getattr(image, 'is_animated', False):
+            return None
+        required = (
+            max(image.size) > max_size
+            or bool(image.getexif())
+            or any(key in image.info for key in ('exif', 'icc_profile', 'xmp'))
+        )
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        image = prepare(image, image_format)
+        image.save(target_path, format=image_format, quality=quality)
+    if not required and (os.path.getsize(target_path)
+                         >= os.path.getsize(source_path)):
+        return None
+    return image_format
+
+
+def make_variants(source_path, target_dir, widths, ratio, quality, formats):
+    """Кадрирует картинку под пропорцию ratio и сохраняет её во всех
+    ширинах widths и форматах formats во временные файлы target_dir.
+
+    Шире исходной картинка не становится. Возвращает список
+    (путь, формат, ширина, высота).
+    """
+    formats = supported_formats(formats)
+    variants = []
+    try:
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image)
+            for width in sorted({min(width, image.width)
+                                 for width in widths}):
+                height = max(1, round(width * ratio[1] / ratio[0]))
+                resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+                for image_format in formats:
+                    handle, path = tempfile.mkstemp(
+                        dir=target_dir, suffix=EXTENSIONS[image_format])
+                    os.close(handle)
+                    variants.append((path, image_format, width, height))
+                    prepare(resized, image_format).save(
+                        path, format=image_format, quality=quality)
+    except Exception:
+        for path, *_ in variants:
+            os.remove(path)
+        raise
+    return variants
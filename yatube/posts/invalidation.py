@@ -0,0 +1,159 @@
+"""Шина инвалидации локальных кэшей процессов.
+
+Обработчики сигналов моделей пишут событие (сущность, id, области)
+в таблицу-outbox InvalidationEvent сразу после изменения. В одной
+транзакции с изменением событие оказывается, только если её открыл
+вызывающий (transaction.atomic); в режиме autocommit это отдельная
+запись, и при падении процесса между ними событие теряется. Поэтому
+шина лишь ускоряет инвалидацию: записи L1 в любом случае живут не
+дольше L1_CACHE_TIMEOUT секунд.
+
+Каждый процесс не чаще INVALIDATION_POLL_INTERVAL секунд дочитывает
+новые события и передаёт их подписчикам — те удаляют затронутые записи
+своих кэшей в памяти. Чтобы не ходить в базу впустую, после коммита
+публикация увеличивает счётчик в общем кэше, и процесс читает таблицу,
+только когда счётчик сдвинулся.
+
+id выдаются при вставке, а видны строки с коммитом, поэтому на базах
+с параллельной записью строка с меньшим id может появиться позже
+прочитанных. Пропущенные id запоминаются как «дыры» и перечитываются
+ещё INVALIDATION_GAP_TIMEOUT секунд.
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import InvalidationEvent
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY = 'invalidation:published'
+
+Event = namedtuple('Event', 'entity object_id scopes')
+
+_subscribers = []
+
+
+class State:
+    """Докуда дочитаны события в этом процессе."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_id = None
+        self.gaps = {}
+        self.counter = None
+        self.checked = 0.0
+        self.purged = time.monotonic()
+
+
+_state = State()
+
+
+def subscribe(handler):
+    """handler(events) вызывается с пачкой новых событий."""
+    _subscribers.append(handler)
+    return handler
+
+
+def bump_counter():
+    try:
+        cache.incr(COUNTER_KEY)
+    except ValueError:
+        cache.add(COUNTER_KEY, 1, None)
+
+
+def publish(entity, object_id, scopes):
+    InvalidationEvent.objects.create(
+        entity=entity, object_id=str(object_id), scopes=json.dumps(scopes))
+    transaction.on_commit(bump_counter)
+
+
+def dispatch(events):
+    for handler in _subscribers:
+        try:
+            handler(events)
+        except Exception:
+            logger.exception('Подписчик %s не обработал события', handler)
+
+
+def purge():
+    InvalidationEvent.objects.filter(
+        created__lt=timezone.now() - timedelta(
+            seconds=settings.INVALIDATION_RETENTION)).delete()
+
+
+def late_rows(events, now):
+    """Строки, закоммиченные позже строк с большими id."""
+    for gap_id, noticed in list(_state.gaps.items()):
+        if now - noticed > settings.INVALIDATION_GAP_TIMEOUT:
+            del _state.gaps[gap_id]
+    if not _state.gaps:
+        return []
+    rows = list(events.filter(id__in=list(_state.gaps)))
+    for row in rows:
+        del _state.gaps[row[0]]
+    return rows
+
+
+def remember_gaps(ids, read_ids, now):
+    for gap_id in ids:
+        if len(_state.gaps) >= settings.INVALIDATION_BATCH_SIZE:
+            # Столько незакоммиченных транзакций не бывает: это откаты
+            # или пропуски последовательности.
+            return
+        if gap_id not in read_ids:
+            _state.gaps[gap_id] = now
+
+
+def poll(force=False):
+    """Применяет новые события. Без force — не чаще интервала и только
+    если счётчик публикаций в общем кэше сдвинулся."""
+    now = time.monotonic()
+    with _state.lock:
+        if not force and now - _state.checked < \
+                settings.INVALIDATION_POLL_INTERVAL:
+            return
+        _state.checked = now
+        counter = cache.get(COUNTER_KEY)
+        if counter is None:
+            cache.add(COUNTER_KEY, 0, None)
+            counter = cache.get(COUNTER_KEY)
+        if _state.last_id is None:
+            # События до запуска процесса не нужны: его кэши пусты.
+            _state.last_id = InvalidationEvent.objects.aggregate(
+                last=Max('id'))['last'] or 0
+            _state.counter = counter
+            return
+        if not force and counter == _state.counter:
+            return
+        _state.counter = counter
+        events = InvalidationEvent.objects.order_by('id').values_list(
+            'id', 'entity', 'object_id', 'scopes')
+        rows = list(events.filter(id__gt=_state.last_id)[
+            :settings.INVALIDATION_BATCH_SIZE])
+        rows.extend(late_rows(events, now))
+        if rows:
+            read_ids = {row[0] for row in rows}
+            newest = max(read_ids)
+            if newest > _state.last_id:
+                remember_gaps(range(_state.last_id + 1, newest), read_ids,
+                              now)
+                _state.last_id = newest
+            if len(rows) >= settings.INVALIDATION_BATCH_SIZE:
+                # Дочитаем остаток при следующем запросе.
+                _state.counter = None
+        if now - _state.purged > settings.INVALIDATION_RETENTION:
+            _state.purged = now
+            purge()
+    if rows:
+        dispatch([Event(entity, object_id, json.loads(scopes))
+                  for _, entity, object_id, scopes in rows])
@@ -0,0 +1,177 @@
+import json
+import platform
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, rank):
+    ordered = sorted(samples)
+    index = max(0, round(rank / 100 * len(ordered)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def dataset_size():
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'follows': Follow.objects.count(),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Замеряет перцентили времени ответа и число SQL-запросов '
+            'страниц posts:* и сохраняет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='',
+            help='Через запятую: до скольких постов догенерировать данные '
+                 'перед каждым замером. Без параметра — текущие данные.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument('--output', default=None)
+        parser.add_argument(
+            '--compare', default=None,
+            help='JSON прошлого запуска: вывести изменение p50 и запросов.')
+
+    def handle(self, *args, sizes, repeat, warmup, cold, output, compare,
+               **options):
+        if repeat < 1:
+            raise CommandError('--repeat должен быть не меньше 1')
+        runs = []
+        for size in [int(size) for size in sizes.split(',') if size] or [0]:
+            missing = size - Post.objects.count()
+            if missing > 0:
+                call_command(
+                    'generate_data', posts=missing,
+                    users=max(missing // 10, 2), groups=max(missing // 500, 1),
+                    comments=missing * 2, follows=missing,
+                    stdout=self.stdout)
+            runs.append({
+                'dataset': dataset_size(),
+                'results': self.measure(repeat, warmup, cold),
+            })
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'cold_cache': cold,
+            'repeat': repeat,
+            'runs': runs,
+        }
+        output = output or 'benchmark-{}.json'.format(
+            timezone.now().strftime('%Y%m%d-%H%M%S'))
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        for run in runs:
+            self.print_run(run)
+        if compare:
+            self.print_comparison(compare, runs[-1])
+        self.stdout.write(self.style.SUCCESS(f'Результат: {output}'))
+
+    def targets(self):
+        """Страницы для замера на самых «тяжёлых» объектах данных."""
+        targets = [('posts:index', reverse('posts:index'), None)]
+        post_count = Post.objects.count()
+        last_page = max(-(-post_count // settings.POSTS_ON_PAGE), 1)
+        targets.append(('posts:index', reverse('posts:index')
+                        + f'?page={last_page}', None))
+        group = Group.objects.annotate(total=Count('posts')).order_by(
+            '-total').first()
+        if group:
+            targets.append(('posts:group_list', reverse(
+                'posts:group_list', args=(group.slug,)), None))
+        author = User.objects.annotate(total=Count('posts')).order_by(
+            '-total').first()
+        if author:
+            targets.append(('posts:profile', reverse(
+                'posts:profile', args=(author.username,)), None))
+        post = Post.objects.order_by('-comments_count').first()
+        if post:
+            targets.append(('posts:post_detail', reverse(
+                'posts:post_detail', args=(post.pk,)), None))
+            targets.append(('posts:post_comments', reverse(
+                'posts:post_comments', args=(post.pk,)), None))
+            targets.append(('posts:post_edit', reverse(
+                'posts:post_edit', args=(post.pk,)), post.author))
+        follower = User.objects.annotate(total=Count('follower')).order_by(
+            '-total').first()
+        if follower:
+            targets.append(('posts:follow_index', reverse(
+                'posts:follow_index'), follower))
+            targets.append(('posts:create', reverse('posts:create'),
+                            follower))
+        return targets
+
+    def measure(self, repeat, warmup, cold):
+        results = []
+        for name, url, user in self.targets():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            timings = []
+            queries = []
+            for attempt in range(warmup + repeat):
+                if cold:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - start
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{url} ответил {response.status_code}')
+                if attempt >= warmup:
+                    timings.append(elapsed * 1000)
+                    queries.append(len(captured))
+            result = {'name': name, 'url': url,
+                      'mean_ms': round(statistics.mean(timings), 2),
+                      'queries': max(queries)}
+            for rank in PERCENTILES:
+                result[f'p{rank}_ms'] = round(percentile(timings, rank), 2)
+            results.append(result)
+        return results
+
+    def print_run(self, run):
+        self.stdout.write(
+            ', '.join(f'{key}: {value}'
+                      for key, value in run['dataset'].items()))
+        for result in run['results']:
+            self.stdout.write(
+                '  {url:<40} p50 {p50_ms:>8} мс  p90 {p90_ms:>8} мс  '
+                'p99 {p99_ms:>8} мс  запросов {queries}'.format(**result))
+
+    def print_comparison(self, path, run):
+        with open(path) as report_file:
+            previous = json.load(report_file)['runs'][-1]['results']
+        previous = {result['url']: result for result in previous}
+        self.stdout.write(f'Сравнение с {path}:')
+        for result in run['results']:
+            before = previous.get(result['url'])
+            if before is None:
+                continue
+            self.stdout.write(
+                '  {:<40} p50 {:+.2f} мс  запросов {:+d}'.format(
+                    result['url'], result['p50_ms'] - before['p50_ms'],
+                    result['queries'] - before['queries']))
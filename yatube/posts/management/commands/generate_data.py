@@ -0,0 +1,166 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from faker import Faker
+
+from posts.bulk import bulk_create, explicit_dates, refresh_derived_data
+from posts.models import Comment, Follow, Group, Post, User
+
+SENTENCES = 500
+
+GROUP_SHARE = 0.7
+
+COMMENT_WINDOW = timedelta(days=7)
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные: пользователей, группы, посты, '
+            'комментарии и подписки с перекошенным распределением '
+            'популярности авторов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=10000,
+            help='Сколько подписок попытаться создать; повторы пропускаются.')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности авторов и постов.')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить даты постов.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, users, groups, posts, comments, follows, skew,
+               days, batch_size, seed, **options):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.skew = skew
+        faker = Faker('ru_RU')
+        faker.seed_instance(seed)
+        self.sentences = [faker.sentence(nb_words=12)
+                          for _ in range(SENTENCES)]
+        self.prefix = f'gen{int(time.time())}{self.random.randrange(1000)}'
+        self.now = timezone.now()
+
+        user_ids = self.step('Пользователи', self.create_users, users)
+        group_ids = self.step('Группы', self.create_groups, groups)
+        post_rows = self.step(
+            'Посты', self.create_posts, posts, user_ids, group_ids, days)
+        commented = self.step(
+            'Комментарии', self.create_comments, comments, user_ids,
+            post_rows)
+        followed = self.step(
+            'Подписки', self.create_follows, follows, user_ids)
+        authors = {author_id for _, _, author_id in post_rows} | followed
+        self.step('Производные данные', lambda: refresh_derived_data(
+            user_ids=user_ids, author_ids=sorted(authors),
+            post_ids=sorted(commented), chunk_size=batch_size))
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def step(self, title, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - start:.1f} с')
+        return result
+
+    def skewed(self, population, k):
+        """k элементов с весами 1 / rank ** skew: немногие популярные
+        и длинный хвост."""
+        weights = accumulate(
+            1 / rank ** self.skew for rank in range(1, len(population) + 1))
+        return self.random.choices(population, cum_weights=list(weights), k=k)
+
+    def text(self):
+        return ' '.join(self.random.sample(
+            self.sentences, self.random.randint(1, 4)))
+
+    def group(self, group_ids):
+        if group_ids and self.random.random() < GROUP_SHARE:
+            return self.random.choice(group_ids)
+        return None
+
+    def create_users(self, count):
+        password = make_password(None)
+        bulk_create(User, (
+            User(username=f'{self.prefix}_{number}', password=password,
+                 first_name=f'Пользователь {number}')
+            for number in range(count)
+        ), self.batch_size)
+        user_ids = list(User.objects.filter(
+            username__startswith=f'{self.prefix}_').values_list(
+            'pk', flat=True))
+        # Популярность не должна совпадать с порядком первичных ключей.
+        self.random.shuffle(user_ids)
+        return user_ids
+
+    def create_groups(self, count):
+        bulk_create(Group, (
+            Group(title=f'Группа {number}',
+                  slug=f'{self.prefix}-{number}',
+                  description=self.text())
+            for number in range(count)
+        ), self.batch_size)
+        return list(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-').values_list('pk', flat=True))
+
+    def create_posts(self, count, user_ids, group_ids, days):
+        last_id = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        authors = self.skewed(user_ids, count) if user_ids else []
+        start = self.now - timedelta(days=days)
+        step = timedelta(days=days) / max(count, 1)
+        with explicit_dates(Post, 'pub_date'):
+            bulk_create(Post, (
+                Post(author_id=author_id, group_id=self.group(group_ids),
+                     text=self.text(), pub_date=start + step * number)
+                for number, author_id in enumerate(authors)
+            ), self.batch_size)
+        return list(Post.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('pk', 'pub_date', 'author_id'))
+
+    def create_comments(self, count, user_ids, post_rows):
+        if not (user_ids and post_rows):
+            return set()
+        # Новые посты обсуждают чаще старых.
+        posts = self.skewed(post_rows[::-1], count)
+        commented = set()
+
+        def comments():
+            for post_id, pub_date, _ in posts:
+                commented.add(post_id)
+                created = pub_date + COMMENT_WINDOW * self.random.random()
+                yield Comment(post_id=post_id,
+                              author_id=self.random.choice(user_ids),
+                              text=self.text(),
+                              created=min(created, self.now))
+
+        with explicit_dates(Comment, 'created'):
+            bulk_create(Comment, comments(), self.batch_size)
+        return commented
+
+    def create_follows(self, count, user_ids):
+        if len(user_ids) < 2:
+            return set()
+        authors = self.skewed(user_ids, count)
+        followed = set()
+
+        def pairs():
+            for author_id in authors:
+                user_id = self.random.choice(user_ids)
+                if user_id != author_id:
+                    followed.add(author_id)
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        bulk_create(Follow, pairs(), self.batch_size, ignore_conflicts=True)
+        return followed
@@ -0,0 +1,351 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.bulk import apply_batch_deltas, chunked, explicit_dates
+from posts.models import Comment, Group, ImportCheckpoint, Post, User
+
+POST = 'post'
+COMMENT = 'comment'
+
+MAX_REPORTED_ERRORS = 20
+
+PROGRESS_INTERVAL = 5
+
+NOT_UTF8 = 'строка не в кодировке UTF-8'
+
+USERNAME_LENGTH = User._meta.get_field('username').max_length
+
+SLUG_LENGTH = Group._meta.get_field('slug').max_length
+
+
+class LookupCache:
+    """Ограниченный LRU-кэш имя → id, чтобы не спрашивать базу
+    о каждом авторе и группе заново и не держать в памяти их все."""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get_many(self, keys, load):
+        found = {}
+        missing = set()
+        for key in keys:
+            if key in self.items:
+                self.items.move_to_end(key)
+                found[key] = self.items[key]
+            else:
+                missing.add(key)
+        if missing:
+            loaded = load(missing)
+            found.update(loaded)
+            self.items.update(loaded)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return found
+
+
+class RowReader:
+    """Построчное чтение JSONL или CSV с учётом смещения в байтах,
+    с которого можно продолжить чтение."""
+
+    def __init__(self, file, file_format, position):
+        self.file = file
+        self.file_format = file_format
+        self.position = position
+        self.undecodable = False
+
+    def __iter__(self):
+        if self.file_format == 'csv':
+            return self.read_csv()
+        return self.read_jsonl()
+
+    def lines(self):
+        """Строки файла; строка не в UTF-8 заменяется пустой
+        с пометкой undecodable."""
+        self.file.seek(self.position)
+        for raw in iter(self.file.readline, b''):
+            self.position += len(raw)
+            try:
+                yield raw.decode('utf-8')
+            except UnicodeDecodeError:
+                self.undecodable = True
+                yield '\n'
+
+    def take_undecodable(self):
+        undecodable, self.undecodable = self.undecodable, False
+        return undecodable
+
+    def read_jsonl(self):
+        for line in self.lines():
+            if self.take_undecodable():
+                yield self.position, None, NOT_UTF8
+                continue
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield self.position, None, f'некорректный JSON: {error}'
+                continue
+            if not isinstance(row, dict):
+                yield self.position, None, 'ожидался объект JSON'
+                continue
+            yield self.position, row, None
+
+    def read_csv(self):
+        self.file.seek(0)
+        header = self.file.readline()
+        fieldnames = next(csv.reader(io.StringIO(header.decode('utf-8'))))
+        self.position = max(self.position, len(header))
+        for values in csv.reader(self.lines()):
+            if self.take_undecodable():
+                yield self.position, None, NOT_UTF8
+                continue
+            if not values:
+                continue
+            if len(values) != len(fieldnames):
+                yield self.position, None, 'неверное число столбцов'
+                continue
+            row = {name: value for name, value in zip(fieldnames, values)
+                   if value != ''}
+            yield self.position, row, None
+
+
+def parse_date(value, now):
+    if value is None:
+        return now
+    date = parse_datetime(str(value))
+    if date is None:
+        raise ValueError(f'некорректная дата {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def parse_id(value):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'некорректный id {value!r}')
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает посты и комментарии из JSONL или CSV '
+            'порциями с продолжением после сбоя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'), default=None,
+            help='По умолчанию определяется по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать файл сначала, а не с сохранённой позиции.')
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Создавать неизвестных авторов и группы.')
+        parser.add_argument('--lookup-cache-size', type=int, default=100000)
+
+    def handle(self, *args, path, format, batch_size, restart,
+               create_missing, lookup_cache_size, **options):
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        file_format = format or (
+            'csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.create_missing = create_missing
+        self.users = LookupCache(lookup_cache_size)
+        self.groups = LookupCache(lookup_cache_size)
+        self.errors = 0
+        self.explicit_ids = False
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=os.path.abspath(path))
+        if restart:
+            checkpoint.position = checkpoint.rows = 0
+        elif checkpoint.position:
+            self.stdout.write(
+                f'Продолжаем с записи {checkpoint.rows + 1} '
+                f'(байт {checkpoint.position})')
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        reported = start
+        imported = 0
+        with open(path, 'rb') as source:
+            reader = RowReader(source, file_format, checkpoint.position)
+            for batch in chunked(reader, batch_size):
+                imported += self.import_batch(batch, checkpoint)
+                now = time.perf_counter()
+                if now - reported >= PROGRESS_INTERVAL:
+                    reported = now
+                    self.report(imported, now - start, checkpoint, size)
+        if self.explicit_ids:
+            self.reset_sequences()
+        self.report(imported, time.perf_counter() - start, checkpoint, size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: загружено {imported}, пропущено {self.errors}'))
+
+    def report(self, imported, elapsed, checkpoint, size):
+        rate = imported / elapsed if elapsed else 0
+        percent = checkpoint.position * 100 / size if size else 100
+        self.stdout.write(
+            f'Загружено {imported} ({rate:.0f} строк/с), '
+            f'прочитано {percent:.1f}% файла')
+
+    def error(self, number, message):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'Запись {number}: {message}')
+        elif self.errors == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write('Дальнейшие ошибки не выводятся')
+
+    def parse(self, row, now):
+        row_type = row.get('type', POST)
+        if row_type not in (POST, COMMENT):
+            raise ValueError(f'неизвестный тип {row_type!r}')
+        if not row.get('text'):
+            raise ValueError('нет текста')
+        if not row.get('author'):
+            raise ValueError('нет автора')
+        if len(str(row['author'])) > USERNAME_LENGTH:
+            raise ValueError('слишком длинное имя автора')
+        parsed = {'type': row_type, 'author': str(row['author']),
+                  'text': str(row['text'])}
+        if row_type == POST:
+            parsed['id'] = parse_id(row.get('id'))
+            parsed['group'] = row.get('group')
+            if parsed['group'] and len(str(parsed['group'])) > SLUG_LENGTH:
+                raise ValueError('слишком длинный slug группы')
+            parsed['pub_date'] = parse_date(row.get('pub_date'), now)
+        else:
+            parsed['post'] = parse_id(row.get('post'))
+            if parsed['post'] is None:
+                raise ValueError('нет поста для комментария')
+            parsed['created'] = parse_date(row.get('created'), now)
+        return parsed
+
+    def import_batch(self, batch, checkpoint):
+        now = timezone.now()
+        rows = []
+        for offset, (position, row, error) in enumerate(batch, 1):
+            number = checkpoint.rows + offset
+            if error is None:
+                try:
+                    rows.append((number, self.parse(row, now)))
+                    continue
+                except ValueError as parse_error:
+                    error = str(parse_error)
+            self.error(number, error)
+        with transaction.atomic():
+            imported = self.save_rows(rows)
+            checkpoint.position = batch[-1][0]
+            checkpoint.rows += len(batch)
+            checkpoint.save()
+        return imported
+
+    def save_rows(self, rows):
+        users = self.users.get_many(
+            {row['author'] for _, row in rows}, self.load_users)
+        groups = self.groups.get_many(
+            {row['group'] for _, row in rows
+             if row['type'] == POST and row['group']}, self.load_groups)
+        last_post_id = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        posts = self.build_posts(rows, users, groups)
+        explicit_ids = [post.pk for post in posts if post.pk is not None]
+        if explicit_ids:
+            self.explicit_ids = True
+        with explicit_dates(Post, 'pub_date'):
+            Post.objects.bulk_create(posts)
+
+        post_ids = {row['post'] for _, row in rows if row['type'] == COMMENT}
+        existing = set(Post.objects.filter(pk__in=post_ids).values_list(
+            'pk', flat=True)) if post_ids else set()
+        comments = []
+        for number, row in rows:
+            if row['type'] != COMMENT:
+                continue
+            if row['author'] not in users:
+                self.error(number, f'неизвестный автор {row["author"]!r}')
+            elif row['post'] not in existing:
+                self.error(number, f'нет поста {row["post"]}')
+            else:
+                comments.append(Comment(
+                    post_id=row['post'], author_id=users[row['author']],
+                    text=row['text'], created=row['created']))
+        with explicit_dates(Comment, 'created'):
+            Comment.objects.bulk_create(comments)
+
+        apply_batch_deltas(posts, comments, last_post_id, explicit_ids)
+        return len(posts) + len(comments)
+
+    def build_posts(self, rows, users, groups):
+        """Посты порции; строки с занятым id, неизвестным автором или
+        группой — ошибки."""
+        taken = self.taken_ids(rows)
+        posts = []
+        for number, row in rows:
+            if row['type'] != POST:
+                continue
+            if row['id'] is not None and row['id'] in taken:
+                self.error(number, f'пост с id {row["id"]} уже есть')
+            elif row['author'] not in users:
+                self.error(number, f'неизвестный автор {row["author"]!r}')
+            elif row['group'] and row['group'] not in groups:
+                self.error(number, f'неизвестная группа {row["group"]!r}')
+            else:
+                posts.append(Post(
+                    pk=row['id'], author_id=users[row['author']],
+                    group_id=groups.get(row['group']), text=row['text'],
+                    pub_date=row['pub_date']))
+                if row['id'] is not None:
+                    taken.add(row['id'])
+        return posts
+
+    def taken_ids(self, rows):
+        """Явные id постов порции, уже занятые в базе."""
+        ids = {row['id'] for _, row in rows
+               if row['type'] == POST and row['id'] is not None}
+        if not ids:
+            return set()
+        return set(Post.objects.filter(pk__in=ids).values_list(
+            'pk', flat=True))
+
+    def load_users(self, usernames):
+        if self.create_missing:
+            password = make_password(None)
+            User.objects.bulk_create(
+                [User(username=username, password=password)
+                 for username in usernames],
+                ignore_conflicts=True)
+        return dict(User.objects.filter(username__in=usernames).values_list(
+            'username', 'pk'))
+
+    def load_groups(self, slugs):
+        if self.create_missing:
+            Group.objects.bulk_create(
+                [Group(slug=slug, title=slug, description='')
+                 for slug in slugs],
+                ignore_conflicts=True)
+        return dict(Group.objects.filter(slug__in=slugs).values_list(
+            'slug', 'pk'))
+
+    def reset_sequences(self):
+        """После вставки с явными id счётчик первичных ключей
+        (например, в PostgreSQL) нужно сдвинуть за максимальный id."""
+        statements = connection.ops.sequence_reset_sql(no_style(), [Post])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
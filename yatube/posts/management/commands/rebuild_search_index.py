@@ -0,0 +1,88 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from posts.models import Post
+from posts.search import FTS_TABLE, search_available
+
+
+def read_chunk(chunk):
+    """Тексты постов с id в диапазоне chunk."""
+    return list(Post.objects.filter(pk__range=chunk).order_by().values_list(
+        'pk', 'text'))
+
+
+def read_chunk_in_thread(chunk):
+    try:
+        return read_chunk(chunk)
+    finally:
+        connections.close_all()
+
+
+def write_chunk(rows):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)', rows)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает полнотекстовый индекс постов порциями по '
+            'диапазонам id. Пока идёт пересборка, поиск находит только '
+            'уже проиндексированные посты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Сколько потоков читают порции параллельно; запись '
+                 'в индекс идёт в одном потоке.')
+
+    def handle(self, *args, chunk_size, workers, **options):
+        if not search_available():
+            raise CommandError('Полнотекстовый индекс есть только в SQLite')
+        bounds = Post.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        if bounds['first'] is None:
+            self.stdout.write(self.style.SUCCESS('Постов нет, индекс пуст'))
+            return
+        chunks = [
+            (first_id, min(first_id + chunk_size - 1, bounds['last']))
+            for first_id in range(bounds['first'], bounds['last'] + 1,
+                                  chunk_size)
+        ]
+        start = time.perf_counter()
+        total = 0
+        # Пишет только этот поток: SQLite допускает одного писателя,
+        # а пул тем временем читает следующие порции.
+        for done, rows in enumerate(self.read(chunks, workers), 1):
+            total += write_chunk(rows)
+            self.stdout.write(
+                f'Порций: {done}/{len(chunks)}, постов: {total}')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {total} '
+            f'за {time.perf_counter() - start:.1f} с'))
+
+    def read(self, chunks, workers):
+        """Порции по порядку; вперёд читается не больше 2 * workers,
+        чтобы тексты не копились в памяти, если запись отстаёт."""
+        if workers <= 1:
+            yield from map(read_chunk, chunks)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(read_chunk_in_thread, chunk))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.timeline import reconcile_timelines
+
+
+class Command(BaseCommand):
+    help = ('Сверяет ленты подписок с подписками после потерянных '
+            'или выполненных не по порядку фоновых задач. Запускать '
+            'после recount_user_stats.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько авторов сверять за один проход.')
+
+    def handle(self, *args, chunk_size, **options):
+        last_id = 0
+        total = 0
+        while True:
+            author_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not author_ids:
+                break
+            reconcile_timelines(author_ids)
+            last_id = author_ids[-1]
+            total += len(author_ids)
+            self.stdout.write(f'Сверено авторов: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, сверено авторов: {total}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Group, Post, User
+from posts.timeline import followed_entries
+
+
+class Command(BaseCommand):
+    help = ('Заводит точные счётчики лент — общей, групп, авторов '
+            'и подписок, в том числе длиннее FEED_COUNT_CAP.')
+
+    def scopes(self):
+        yield counters.ALL, Post.objects.all()
+        for group_id in Group.objects.values_list('pk', flat=True).iterator():
+            yield (counters.group_scope(group_id),
+                   Post.objects.filter(group_id=group_id))
+        for user_id in User.objects.values_list('pk', flat=True).iterator():
+            yield (counters.author_scope(user_id),
+                   Post.objects.filter(author_id=user_id))
+            yield (counters.follow_scope(user_id),
+                   followed_entries(user_id))
+
+    def handle(self, *args, **options):
+        total = 0
+        for scope, queryset in self.scopes():
+            counters.seed_counter(scope, queryset)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, пересчитано лент: {total}'))
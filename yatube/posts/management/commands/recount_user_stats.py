@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.stats import recount_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов и подписок пользователей порциями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько пользователей пересчитывать в одной транзакции.')
+
+    def handle(self, *args, chunk_size, **options):
+        last_id = 0
+        total = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            recount_stats(user_ids)
+            last_id = user_ids[-1]
+            total += len(user_ids)
+            self.stdout.write(f'Пересчитано пользователей: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, пересчитано пользователей: {total}'))
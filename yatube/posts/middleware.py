@@ -0,0 +1,14 @@
+from . import invalidation
+
+
+class InvalidationMiddleware:
+    """Перед запросом применяет события шины инвалидации, так что
+    локальные кэши процесса отстают не больше чем на
+    INVALIDATION_POLL_INTERVAL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        invalidation.poll()
+        return self.get_response(request)
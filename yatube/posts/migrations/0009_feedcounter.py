@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64, unique=True, verbose_name='Лента')),
+                ('value', models.IntegerField(default=0, verbose_name='Количество постов')),
+            ],
+            options={
+                'verbose_name': 'Счётчик ленты',
+                'verbose_name_plural': 'Счётчики лент',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_comments(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Post = apps.get_model('posts', 'Post')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(total=Count('pk')).values('total')
+    Post.objects.filter(comments__isnull=False).update(
+        comments_count=Subquery(comments))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_userstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0, verbose_name='Количество комментариев'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
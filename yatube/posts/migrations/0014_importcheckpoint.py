@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Смещение в байтах')),
+                ('rows', models.BigIntegerField(default=0, verbose_name='Прочитано строк')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлён')),
+            ],
+            options={
+                'verbose_name': 'Точка продолжения импорта',
+                'verbose_name_plural': 'Точки продолжения импорта',
+            },
+        ),
+    ]
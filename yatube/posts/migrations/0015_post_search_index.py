@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# Внешний (external content) индекс FTS5 поверх posts_post: текст не
+# дублируется, а триггеры поддерживают индекс при любых изменениях
+# таблицы, в том числе при bulk_create и update().
+CREATE_INDEX = (
+    """
+    CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')",
+)
+
+DROP_INDEX = (
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TABLE IF EXISTS posts_post_fts',
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # FTS5 есть только в SQLite; на других базах поиск работает
+        # через icontains.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_INDEX), run(DROP_INDEX)),
+    ]
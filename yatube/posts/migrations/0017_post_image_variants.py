@@ -0,0 +1,30 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('posts.migrations.0015_post_search_index')
+
+# На SQLite AddField и RemoveField пересоздают posts_post, а вместе
+# со старой таблицей пропадают триггеры поискового индекса.
+CREATE_TRIGGERS = tuple(
+    statement for statement in search_index.CREATE_INDEX
+    if 'CREATE TRIGGER' in statement)
+
+restore_triggers = search_index.run(CREATE_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.TextField(blank=True, editable=False, help_text='JSON с файлами картинки разной ширины и формата', verbose_name='Варианты картинки'),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
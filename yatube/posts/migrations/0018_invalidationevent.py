@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvalidationEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=20, verbose_name='Сущность')),
+                ('object_id', models.CharField(max_length=150, verbose_name='Идентификатор')),
+                ('scopes', models.TextField(verbose_name='Затронутые области (JSON)')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Событие инвалидации',
+                'verbose_name_plural': 'События инвалидации',
+            },
+        ),
+    ]
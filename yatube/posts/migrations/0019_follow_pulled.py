@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:16
+
+from django.db import migrations, models
+
+
+def mark_pulled_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    Follow.objects.filter(author_id__in=Post.objects.filter(
+        fanned_out=False).values('author_id')).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_invalidationevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='pulled',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Посты автора подмешиваются при чтении'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(condition=models.Q(pulled=True), fields=['user', 'author'], name='follow_pulled'),
+        ),
+        migrations.RunPython(mark_pulled_follows,
+                             migrations.RunPython.noop),
+    ]
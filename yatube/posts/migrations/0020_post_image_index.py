@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_follow_pulled'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['image'], name='post_image'),
+        ),
+    ]
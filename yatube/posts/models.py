@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.conf import settings
@@ -28,15 +30,45 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    image_variants = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Варианты картинки',
+        help_text='JSON с файлами картинки разной ширины и формата',
+    )
+    fanned_out = models.BooleanField(
+        default=True,
+        verbose_name='Разослан в ленты подписчиков',
+    )
+    comments_count = models.IntegerField(
+        default=0,
+        verbose_name='Количество комментариев',
+    )
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date', 'author',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         condition=models.Q(fanned_out=False),
+                         name='post_not_fanned_out'),
+            models.Index(fields=('image',), name='post_image'),
+        )
 
     def __str__(self):
         return self.text[:settings.THIRTY]
 
+    @property
+    def variants(self):
+        return json.loads(self.image_variants) if self.image_variants else None
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Создание группы')
@@ -77,6 +109,12 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий',
         verbose_name_plural = 'Comment'
+        indexes = (
+            models.Index(fields=('post', '-created', '-id'),
+                         name='comment_post_created'),
+            models.Index(fields=('-created', '-id'),
+                         name='comment_created'),
+        )
 
     def __str__(self):
         return self.text[:settings.THIRTY]
@@ -97,10 +135,141 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор'
     )
+    pulled = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Посты автора подмешиваются при чтении',
+    )
 
     class Meta:
         verbose_name = 'Follow',
         verbose_name_plural = 'Following'
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='unique_follow'),
+        )
+        indexes = (
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_user'),
+            models.Index(fields=('user', 'author'),
+                         condition=models.Q(pulled=True),
+                         name='follow_pulled'),
+        )
 
     def __str__(self):
         return f'Пользователь {self.user} подписан на автора {self.author}'
+
+
+class FeedCounter(models.Model):
+    scope = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Лента',
+    )
+    value = models.IntegerField(default=0, verbose_name='Количество постов')
+
+    class Meta:
+        verbose_name = 'Счётчик ленты'
+        verbose_name_plural = 'Счётчики лент'
+
+    def __str__(self):
+        return f'{self.scope}: {self.value}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_timeline_entry'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date'),
+            models.Index(fields=('user', 'author'),
+                         name='timeline_user_author'),
+        )
+
+    def __str__(self):
+        return f'{self.post_id} в ленте {self.user}'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.IntegerField(default=0, verbose_name='Постов')
+    followers_count = models.IntegerField(default=0,
+                                          verbose_name='Подписчиков')
+    following_count = models.IntegerField(default=0, verbose_name='Подписок')
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return f'Статистика {self.user}'
+
+
+class ImportCheckpoint(models.Model):
+    """Докуда дочитан файл импорта: сохраняется в одной транзакции
+    с очередной порцией строк."""
+    source = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл',
+    )
+    position = models.BigIntegerField(default=0,
+                                      verbose_name='Смещение в байтах')
+    rows = models.BigIntegerField(default=0, verbose_name='Прочитано строк')
+    updated = models.DateTimeField(auto_now=True, verbose_name='Обновлён')
+
+    class Meta:
+        verbose_name = 'Точка продолжения импорта'
+        verbose_name_plural = 'Точки продолжения импорта'
+
+    def __str__(self):
+        return f'{self.source}: {self.rows}'
+
+
+class InvalidationEvent(models.Model):
+    """Исходящее событие об изменении данных: пишется в одной транзакции
+    с изменением, а каждый процесс по нему чистит свои локальные кэши."""
+    entity = models.CharField(max_length=20, verbose_name='Сущность')
+    object_id = models.CharField(max_length=150,
+                                 verbose_name='Идентификатор')
+    scopes = models.TextField(verbose_name='Затронутые области (JSON)')
+    created = models.DateTimeField(auto_now_add=True, db_index=True,
+                                   verbose_name='Создано')
+
+    class Meta:
+        verbose_name = 'Событие инвалидации'
+        verbose_name_plural = 'События инвалидации'
+
+    def __str__(self):
+        return f'{self.entity}:{self.object_id}'
@@ -0,0 +1,173 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .utils import (NEXT, PREVIOUS, CursorPage, CursorPaginator,
+                    decode_cursor, encode_cursor)
+
+FTS_TABLE = 'posts_post_fts'
+
+WORD = re.compile(r'\w+')
+
+# Символы-маркеры совпадений в snippet(): текст поста экранируется,
+# и только после этого маркеры превращаются в <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+SNIPPET_TOKENS = 32
+
+
+def rank_key(value):
+    """Первый ключ курсора поиска — ранг bm25, число."""
+    if type(value) not in (int, float):
+        raise ValueError('Некорректный курсор')
+    return float(value)
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_query(query):
+    """Запрос пользователя в синтаксисе FTS5: каждое слово в кавычках,
+    чтобы операторы FTS5 не принимались из ввода; последнее слово —
+    по префиксу, пока пользователь его допечатывает."""
+    words = WORD.findall(query or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def filter_matching(queryset, match):
+    """Посты queryset, подходящие под запрос FTS5. Через extra(), потому
+    что RawSQL в __in Django оборачивает в скалярный подзапрос."""
+    table = connection.ops.quote_name(Post._meta.db_table)
+    return queryset.extra(
+        where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s)'],
+        params=[match],
+    )
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>'))
+
+
+class SearchPaginator:
+    """Курсорная пагинация результатов по (релевантность, id)."""
+    keys = ('rank', 'id')
+
+    def __init__(self, match, group_id=None, author_id=None):
+        self.match = match
+        self.group_id = group_id
+        self.author_id = author_id
+        self.per_page = settings.POSTS_ON_PAGE
+
+    def rows(self, values, after, limit):
+        rank = f'bm25({FTS_TABLE})'
+        order = 'ASC' if after else 'DESC'
+        conditions = [f'{FTS_TABLE} MATCH %s']
+        params = [self.match]
+        if self.group_id is not None:
+            conditions.append('post.group_id = %s')
+            params.append(self.group_id)
+        if self.author_id is not None:
+            conditions.append('post.author_id = %s')
+            params.append(self.author_id)
+        if values is not None:
+            op = '>' if after else '<'
+            conditions.append(
+                f'({rank} {op} %s OR ({rank} = %s AND post.id {op} %s))')
+            params.extend([values[0], values[0], values[1]])
+        sql = f"""
+            SELECT post.id, {rank},
+                   snippet({FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS})
+            FROM {FTS_TABLE}
+            JOIN {Post._meta.db_table} post ON post.id = {FTS_TABLE}.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {rank} {order}, post.id {order}
+            LIMIT %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [MARK_START, MARK_END, *params, limit])
+            return cursor.fetchall()
+
+    def page(self, cursor=None):
+        if cursor is None:
+            direction, number, values = NEXT, settings.NUMBER_ONE, None
+        else:
+            direction, number, values = decode_cursor(cursor, rank_key)
+            if len(values) != len(self.keys):
+                raise ValueError('Некорректный курсор')
+        after = direction == NEXT
+        rows = self.rows(values, after, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not after:
+            rows.reverse()
+            if not has_more:
+                number = settings.NUMBER_ONE
+        has_next = has_more if after else True
+        has_previous = has_more if not after else values is not None
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [post_id for post_id, _, _ in rows])
+        results = []
+        for post_id, rank, snippet in rows:
+            post = posts.get(post_id)
+            if post is None:
+                continue
+            post.search_rank = rank
+            post.search_snippet = highlight(snippet)
+            results.append(post)
+        if not rows:
+            return CursorPage(results, number, self)
+        first_id, first_rank, _ = rows[0]
+        last_id, last_rank, _ = rows[-1]
+        return CursorPage(
+            results, number, self,
+            next_cursor=(encode_cursor(NEXT, number + 1, [last_rank, last_id])
+                         if has_next else None),
+            previous_cursor=(
+                encode_cursor(PREVIOUS, number - 1, [first_rank, first_id])
+                if has_previous else None),
+        )
+
+
+def fallback_page(query, group_id, author_id, cursor):
+    """Поиск без FTS5 (не SQLite): LIKE по тексту, новые посты первыми."""
+    posts = Post.objects.select_related('author', 'group').filter(
+        text__icontains=query)
+    if group_id is not None:
+        posts = posts.filter(group_id=group_id)
+    if author_id is not None:
+        posts = posts.filter(author_id=author_id)
+    paginator = CursorPaginator(posts, settings.POSTS_ON_PAGE)
+    try:
+        page = paginator.cursor_page(cursor)
+    except ValueError:
+        page = paginator.cursor_page()
+    for post in page:
+        post.search_snippet = escape(post.text)
+    return page
+
+
+def search_page(query, group_id=None, author_id=None, cursor=None):
+    """Страница результатов поиска или None, если в запросе нет слов."""
+    match = match_query(query)
+    if match is None:
+        return None
+    if not search_available():
+        return fallback_page(query, group_id, author_id, cursor)
+    paginator = SearchPaginator(match, group_id, author_id)
+    try:
+        return paginator.page(cursor)
+    except ValueError:
+        return paginator.page()
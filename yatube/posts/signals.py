@@ -0,0 +1,249 @@
+import json
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (cache, counters, identity, invalidation, stats, timeline,
+               uploads)
+from .models import Comment, Follow, Group, Post, User
+from .tasks import run_in_background
+
+
+# Поля пользователя, которых нет на страницах. update_last_login
+# сохраняет пользователя при каждом входе, и такие сохранения
+# не должны сбрасывать ленты, карточки и кэш поиска пользователей.
+UNRENDERED_USER_FIELDS = frozenset(('last_login', 'password'))
+
+
+def unrendered_save(sender, update_fields=None):
+    return (sender is User and update_fields is not None
+            and update_fields <= UNRENDERED_USER_FIELDS)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_scopes(sender, instance, raw, **kwargs):
+    instance._previous_scopes = []
+    instance._previous_author_id = None
+    instance._previous_image = None
+    instance._previous_variants = None
+    if raw or instance.pk is None:
+        return
+    previous = Post.objects.filter(pk=instance.pk).values(
+        'author_id', 'group_id', 'image', 'image_variants').first()
+    if previous:
+        instance._previous_scopes = counters.post_scopes(
+            previous['author_id'], previous['group_id'])
+        instance._previous_author_id = previous['author_id']
+        instance._previous_image = previous['image']
+        if previous['image'] != instance.image.name:
+            # Варианты старой картинки больше не подходят.
+            instance.image_variants = ''
+            instance._previous_variants = previous['image_variants']
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    scopes = counters.post_scopes(instance.author_id, instance.group_id)
+    previous = getattr(instance, '_previous_scopes', [])
+    counters.change_counters(
+        [scope for scope in scopes if scope not in previous], 1)
+    counters.change_counters(
+        [scope for scope in previous if scope not in scopes], -1)
+    # Ленты подписчиков меняются только с появлением поста у автора
+    # или сменой автора, но не при правке текста.
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if created or previous_author_id is None:
+        counters.change_follower_counters(instance.author_id, 1)
+    elif previous_author_id != instance.author_id:
+        counters.change_follower_counters(previous_author_id, -1)
+        counters.change_follower_counters(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_counters(
+        counters.post_scopes(instance.author_id, instance.group_id), -1)
+    counters.change_follower_counters(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_follow_counter(sender, instance, raw=False, **kwargs):
+    if not raw:
+        counters.reset_counters([counters.follow_scope(instance.user_id)])
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(
+        comments_count=F('comments_count') - 1)
+
+
+# Статистика должна обновиться раньше раскладки по лентам:
+# fan_out_post читает число подписчиков автора.
+@receiver(post_save, sender=Post)
+def count_author_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        stats.change_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_author_post(sender, instance, **kwargs):
+    stats.change_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        stats.change_stats(instance.user_id, following_count=1)
+        stats.change_stats(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    stats.change_stats(instance.user_id, following_count=-1)
+    stats.change_stats(instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_created_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        run_in_background(timeline.fan_out_post, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def process_uploaded_image(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    previous_variants = getattr(instance, '_previous_variants', None)
+    if previous_variants:
+        run_in_background(uploads.delete_variants,
+                          json.loads(previous_variants))
+    if not instance.image:
+        return
+    if instance.image.name != getattr(instance, '_previous_image', None):
+        run_in_background(uploads.process_post_image, instance.pk,
+                          instance.image.name)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_follower_timeline(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        run_in_background(timeline.backfill_timeline, instance.user_id,
+                          instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_follower_timeline(sender, instance, **kwargs):
+    run_in_background(timeline.remove_from_timeline, instance.user_id,
+                      instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_feed_version(sender, update_fields=None, **kwargs):
+    if not unrendered_save(sender, update_fields):
+        cache.bump_version(cache.FEED_VERSION)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_version(sender, instance, **kwargs):
+    cache.bump_version(f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, instance, update_fields=None, **kwargs):
+    if not unrendered_save(sender, update_fields):
+        cache.bump_version(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_version(sender, instance, **kwargs):
+    cache.bump_version(f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comments_version(sender, instance, **kwargs):
+    cache.bump_version(f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follows_version(sender, instance, **kwargs):
+    cache.bump_version(f'follows:{instance.user_id}')
+    cache.bump_version(f'follows:{instance.author_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group_identity(sender, instance, raw=False, **kwargs):
+    if not raw:
+        identity.forget_group(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_identity(sender, instance, raw=False, update_fields=None,
+                         **kwargs):
+    if not raw and not unrendered_save(sender, update_fields):
+        identity.forget_user(instance)
+
+
+# Публикация в шину инвалидации — последней, после сдвига версий.
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def publish_post_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidation.publish('post', instance.pk, [
+            cache.FEED_VERSION, *cache.post_version_names(instance)])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def publish_comment_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidation.publish('comment', instance.pk,
+                             [f'comments:{instance.post_id}'])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def publish_follow_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidation.publish('follow', instance.pk, [
+            f'follows:{instance.user_id}', f'follows:{instance.author_id}'])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def publish_group_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidation.publish('group', instance.pk, [
+            cache.FEED_VERSION, f'group:{instance.pk}'])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def publish_user_change(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    if not raw and not unrendered_save(sender, update_fields):
+        invalidation.publish('user', instance.pk, [
+            cache.FEED_VERSION, f'user:{instance.pk}'])
@@ -0,0 +1,49 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Follow, Post, UserStats
+
+
+def count_by(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by().values(field)
+        .annotate(total=Count('pk')).values_list(field, 'total')
+    )
+
+
+def recount_stats(user_ids):
+    """Пересчитывает статистику пользователей одним набором запросов."""
+    user_ids = list(user_ids)
+    posts = count_by(Post.objects, 'author_id', user_ids)
+    followers = count_by(Follow.objects, 'author_id', user_ids)
+    following = count_by(Follow.objects, 'user_id', user_ids)
+    stats = [
+        UserStats(
+            user_id=user_id,
+            posts_count=posts.get(user_id, 0),
+            followers_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    ]
+    with transaction.atomic():
+        UserStats.objects.filter(user_id__in=user_ids).delete()
+        UserStats.objects.bulk_create(stats)
+    return stats
+
+
+def get_user_stats(user_id):
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is not None:
+        return stats
+    try:
+        return recount_stats([user_id])[0]
+    except IntegrityError:
+        return UserStats.objects.get(user_id=user_id)
+
+
+def change_stats(user_id, **deltas):
+    """Сдвигает счётчики существующей записи; отсутствующая запись
+    будет посчитана при первом чтении."""
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()})
@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASKS_WORKERS,
+            thread_name_prefix='yatube-task',
+        )
+    return _executor
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """Запускает func(*args) в пуле потоков после коммита транзакции.
+
+    При BACKGROUND_TASKS_ASYNC = False задача выполняется сразу,
+    в текущей транзакции.
+    """
+    if not settings.BACKGROUND_TASKS_ASYNC:
+        func(*args)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run, func, args))
@@ -0,0 +1,52 @@
+from django import template
+
+from .. import cache, thumbnails
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, scope, vary_on):
+        self.nodelist = nodelist
+        self.scope = scope
+        self.vary_on = vary_on
+
+    def render(self, context):
+        key = cache.fragment_key(
+            self.scope.resolve(context),
+            context['request'],
+            [var.resolve(context) for var in self.vary_on],
+        )
+        return cache.get_or_render(key, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def feed_cache(parser, token):
+    """
+    Кэширует фрагмент ленты до следующего изменения постов, групп
+    или пользователей::
+
+        {% feed_cache 'index' [vary_on ...] %} ... {% endfeed_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 1 argument.")
+    nodelist = parser.parse(('endfeed_cache',))
+    parser.delete_first_token()
+    return FeedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
+
+
+@register.simple_tag
+def post_cards(posts, template_name, **extra):
+    """
+    Отрендеренные карточки постов страницы из общего кэша::
+
+        {% post_cards page_obj 'posts/includes/post_list.html' as cards %}
+    """
+    return cache.render_cards(posts, template_name, extra,
+                              prepare=thumbnails.attach)
@@ -0,0 +1,58 @@
+from django import template
+from django.conf import settings
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, geometry):
+    """
+    Миниатюра картинки поста размера из POST_THUMBNAILS::
+
+        {% post_thumbnail post '960x339' as im %}
+
+    Для карточек ленты миниатюры всей страницы уже найдены одним
+    пакетом в {% post_cards %}; иначе пост разрешается отдельно.
+    """
+    if not post.image:
+        return None
+    if not hasattr(post, 'thumbnails'):
+        thumbnails.attach([post])
+    return getattr(post, 'thumbnails', {}).get(geometry)
+
+
+@register.inclusion_tag('posts/includes/post_picture.html')
+def post_picture(post, geometry):
+    """
+    Картинка поста с srcset по вариантам из post.image_variants::
+
+        {% post_picture post '960x339' %}
+
+    URL собираются из манифеста без обращений к диску и sorl. Пока
+    вариантов нет, показывается миниатюра geometry.
+    """
+    manifest = post.variants if post.image else None
+    if manifest is None:
+        width, height = geometry.split('x')
+        return {'thumbnail': post_thumbnail(post, geometry),
+                'width': width, 'height': height}
+    storage = post.image.storage
+    sources = [
+        {'type': source['type'],
+         'srcset': ', '.join(f'{storage.url(name)} {width}w'
+                             for name, width in source['files'])}
+        for source in manifest['sources']
+    ]
+    # Для браузеров без srcset — вариант последнего формата,
+    # ближайший по ширине к кадру карточки.
+    name, _ = min(manifest['sources'][-1]['files'],
+                  key=lambda variant: abs(variant[1] - manifest['width']))
+    return {
+        'sources': sources,
+        'src': storage.url(name),
+        'sizes': settings.IMAGE_VARIANT_SIZES,
+        'width': manifest['width'],
+        'height': manifest['height'],
+    }
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Group, Post, User
+
+NUMBER_POSTS = 5
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.long_text = 'начало ' + 'середина ' * 100 + 'конец'
+        cls.posts = [
+            Post.objects.create(author=cls.admin, group=cls.group,
+                                text=cls.long_text)
+            for _ in range(NUMBER_POSTS)
+        ]
+        Comment.objects.create(post=cls.posts[0], author=cls.admin,
+                               text=cls.long_text)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_text_truncated(self):
+        """В списке показывается только начало текста."""
+        for name in ('admin:posts_post_changelist',
+                     'admin:posts_comment_changelist'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                content = response.content.decode()
+                self.assertIn('начало', content)
+                self.assertNotIn('конец', content)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        return len(captured)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов списка не растёт с числом строк."""
+        url = reverse('admin:posts_post_changelist')
+        self.count_queries(url)
+        before = self.count_queries(url)
+        for _ in range(NUMBER_POSTS):
+            Post.objects.create(author=self.admin, group=self.group,
+                                text='Ещё пост')
+        self.count_queries(url)
+        self.assertEqual(self.count_queries(url), before)
+
+    @override_settings(FEED_COUNT_CAP=3)
+    def test_count_capped(self):
+        """Счётчик результатов не считает дальше FEED_COUNT_CAP."""
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 3)
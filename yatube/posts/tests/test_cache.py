@@ -0,0 +1,115 @@
+from http import HTTPStatus
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import cache as posts_cache
+from ..models import Group, Post, User
+
+CARD_TEMPLATE = 'posts/includes/post_list.html'
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName',
+                                            first_name='Имя')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        posts = Post.objects.select_related('author', 'group')
+        with mock.patch.object(posts_cache, 'render_to_string',
+                               wraps=posts_cache.render_to_string) as render:
+            cards = posts_cache.render_cards(posts, CARD_TEMPLATE,
+                                             {'group_link': True})
+        return cards, render.call_count
+
+    def test_cards_are_cached(self):
+        """Повторная страница собирается из кэша без рендеринга."""
+        cards, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn('Тестовый пост', cards[0])
+        cached_cards, renders = self.render()
+        self.assertEqual(renders, 0)
+        self.assertEqual(cached_cards, cards)
+
+    def test_cards_invalidated(self):
+        """Карточка перерисовывается после изменения поста или автора."""
+        self.render()
+        self.post.text = 'Изменённый пост'
+        self.post.save()
+        cards, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn('Изменённый пост', cards[0])
+        self.user.first_name = 'Другое'
+        self.user.save()
+        cards, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn('Другое', cards[0])
+
+    def test_login_keeps_caches(self):
+        """Вход пользователя не сбрасывает ленты и карточки."""
+        feed_version = posts_cache.get_version(posts_cache.FEED_VERSION)
+        self.render()
+        self.client.force_login(self.user)
+        self.assertEqual(posts_cache.get_version(posts_cache.FEED_VERSION),
+                         feed_version)
+        _, renders = self.render()
+        self.assertEqual(renders, 0)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag получает 304, пока страница не менялась."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.id,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('stale-while-revalidate',
+                              response['Cache-Control'])
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+
+    def test_modified_after_edit(self):
+        """Редактирование поста меняет ETag страницы поста."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        etag = self.client.get(url)['ETag']
+        self.post.text = 'Изменённый пост'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_authorized_private(self):
+        """Страницы для авторизованных не попадают в общие кэши."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn('private', response['Cache-Control'])
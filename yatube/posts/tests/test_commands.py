@@ -0,0 +1,180 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import TestCase
+
+from ..models import (Comment, Follow, Group, ImportCheckpoint, Post,
+                      TimelineEntry, User, UserStats)
+
+
+class GenerateDataTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command('generate_data', users=30, groups=3, posts=200,
+                     comments=300, follows=150, batch_size=50, seed=1,
+                     stdout=StringIO())
+
+    def test_rows_created(self):
+        """Создаются пользователи, посты, комментарии и подписки."""
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Follow.objects.exists())
+
+    def test_followers_skewed(self):
+        """Самый популярный автор собирает заметную долю подписок."""
+        top = Follow.objects.values('author').annotate(
+            total=Count('pk')).order_by('-total').first()
+        self.assertGreater(top['total'], Follow.objects.count() / 10)
+
+    def test_dates_spread(self):
+        """Даты постов заданы генератором, а не временем вставки."""
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater((max(dates) - min(dates)).days, 300)
+
+    def test_derived_data_refreshed(self):
+        """Счётчики, статистика и ленты согласованы с данными."""
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        follow = Follow.objects.first()
+        stats = UserStats.objects.get(user_id=follow.author_id)
+        self.assertEqual(stats.followers_count,
+                         Follow.objects.filter(
+                             author_id=follow.author_id).count())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user_id=follow.user_id,
+                                         author_id=follow.author_id).count(),
+            Post.objects.filter(author_id=follow.author_id).count())
+
+
+class BenchmarkTest(TestCase):
+    def test_report_saved(self):
+        """Замер сохраняет перцентили и число запросов по страницам."""
+        cache.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command('benchmark', sizes='50', repeat=2, warmup=0,
+                         output=output, stdout=StringIO())
+            with open(output) as report_file:
+                report = json.load(report_file)
+        run = report['runs'][0]
+        self.assertEqual(run['dataset']['posts'], 50)
+        names = {result['name'] for result in run['results']}
+        self.assertIn('posts:index', names)
+        self.assertIn('posts:follow_index', names)
+        for result in run['results']:
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries'], 0)
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Group.objects.create(title='Группа', slug='group', description='')
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content, mode='w'):
+        path = os.path.join(self.directory.name, name)
+        with open(path, mode, encoding='utf-8') as source:
+            source.write(content)
+        return path
+
+    def jsonl(self, rows):
+        return ''.join(json.dumps(row, ensure_ascii=False) + '\n'
+                       for row in rows)
+
+    def test_posts_and_comments_imported(self):
+        """Посты и комментарии загружаются, ошибочные строки пропускаются,
+        производные данные пересчитываются."""
+        path = self.write('data.jsonl', self.jsonl([
+            {'id': 100, 'author': 'author', 'group': 'group',
+             'text': 'Первый', 'pub_date': '2020-01-01T10:00:00'},
+            {'author': 'nobody', 'text': 'Неизвестный автор'},
+            {'type': 'comment', 'post': 100, 'author': 'reader',
+             'text': 'Комментарий'},
+        ]) + 'не json\n')
+        errors = StringIO()
+        call_command('import_posts', path, batch_size=2, stdout=StringIO(),
+                     stderr=errors)
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.group.slug, 'group')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         1)
+        self.assertIn('nobody', errors.getvalue())
+        self.assertIn('Запись 4', errors.getvalue())
+
+    def test_duplicate_ids_and_bad_encoding_reported(self):
+        """Занятые id и строки не в UTF-8 — ошибки строк, импорт
+        продолжается."""
+        existing = Post.objects.create(text='Уже есть', author=self.author)
+        path = self.write('data.jsonl', self.jsonl([
+            {'id': existing.pk, 'author': 'author', 'text': 'Повтор'},
+            {'id': 200, 'author': 'author', 'text': 'Новый'},
+            {'id': 200, 'author': 'author', 'text': 'Повтор в порции'},
+        ]))
+        with open(path, 'ab') as source:
+            source.write('{"author": "author", "text": "Ошибка"}\n'
+                         .encode('cp1251'))
+            source.write(b'{"author": "author", "text": "\xff"}\n')
+            source.write(self.jsonl([
+                {'author': 'author', 'text': 'После ошибки'},
+            ]).encode())
+        errors = StringIO()
+        call_command('import_posts', path, batch_size=2, stdout=StringIO(),
+                     stderr=errors)
+        self.assertEqual(Post.objects.get(pk=existing.pk).text, 'Уже есть')
+        self.assertEqual(Post.objects.get(pk=200).text, 'Новый')
+        self.assertTrue(Post.objects.filter(text='После ошибки').exists())
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         Post.objects.filter(author=self.author).count())
+        for number in (1, 3, 5):
+            self.assertIn(f'Запись {number}:', errors.getvalue())
+        self.assertIn('UTF-8', errors.getvalue())
+
+    def test_resume_from_checkpoint(self):
+        """Повторный запуск продолжает файл с сохранённой позиции."""
+        path = self.write('data.jsonl', self.jsonl([
+            {'author': 'author', 'text': 'Первый'},
+        ]))
+        call_command('import_posts', path, stdout=StringIO())
+        self.write('data.jsonl', self.jsonl([
+            {'author': 'author', 'text': 'Второй'},
+        ]), mode='a')
+        output = StringIO()
+        call_command('import_posts', path, stdout=output)
+        self.assertIn('Продолжаем с записи 2', output.getvalue())
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('text', flat=True)),
+            ['Первый', 'Второй'])
+        self.assertEqual(
+            ImportCheckpoint.objects.get(source=path).rows, 2)
+
+    def test_csv_with_missing_objects_created(self):
+        """CSV с --create-missing создаёт неизвестных авторов и группы."""
+        path = self.write(
+            'data.csv',
+            'author,group,text\n'
+            'newcomer,new-group,"Текст,\nв две строки"\n')
+        call_command('import_posts', path, create_missing=True,
+                     stdout=StringIO())
+        post = Post.objects.get(author__username='newcomer')
+        self.assertEqual(post.text, 'Текст,\nв две строки')
+        self.assertEqual(post.group.slug, 'new-group')
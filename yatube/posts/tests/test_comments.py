@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Post, User
+
+NUMBER_COMMENTS = 25
+
+
+class CommentsPageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+        for index in range(NUMBER_COMMENTS):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'user{index}'),
+                text=f'Комментарий {index}',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:post_detail', args=(self.post.id,))
+
+    def test_comments_count(self):
+        """Количество комментариев хранится в посте."""
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, NUMBER_COMMENTS)
+        Comment.objects.filter(post=self.post).first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, NUMBER_COMMENTS - 1)
+
+    def test_comments_pages(self):
+        """Комментарии выводятся страницами по курсору."""
+        first_page = self.client.get(self.url).context['comments']
+        self.assertEqual(len(first_page), settings.COMMENTS_ON_PAGE)
+        self.assertEqual(first_page[0].text,
+                         f'Комментарий {NUMBER_COMMENTS - 1}')
+        response = self.client.get(self.url,
+                                   {'cursor': first_page.next_cursor})
+        second_page = response.context['comments']
+        self.assertEqual(len(second_page),
+                         NUMBER_COMMENTS - settings.COMMENTS_ON_PAGE)
+        self.assertFalse(second_page.has_next())
+
+    def test_comment_authors_prefetched(self):
+        """Авторы комментариев не запрашиваются по одному."""
+        client = Client()
+        client.get(self.url)
+        with self.assertNumQueries(6):
+            client.get(self.url)
+
+    @override_settings(COMMENTS_DEFERRED=True)
+    def test_comments_fragment(self):
+        """Комментарии можно загрузить отдельным фрагментом."""
+        response = self.client.get(self.url)
+        self.assertNotIn('comments', response.context)
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.id,)))
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertContains(response, f'Комментарий {NUMBER_COMMENTS - 1}')
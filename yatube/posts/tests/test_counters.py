@@ -0,0 +1,123 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .. import counters
+from ..models import FeedCounter, Follow, Group, Post, User
+
+
+class FeedCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.another_group = Group.objects.create(
+            title='Другая группа',
+            slug='another-slug',
+            description='Другое описание',
+        )
+        Post.objects.create(text='Тестовый пост', author=cls.user,
+                            group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_counter(self, scope):
+        return FeedCounter.objects.get(scope=scope).value
+
+    def test_counter_created_on_first_read(self):
+        """Счётчик ленты заводится при первом чтении."""
+        self.assertEqual(
+            counters.get_count(counters.ALL, Post.objects.all()), (1, True))
+        self.assertEqual(self.get_counter(counters.ALL), 1)
+
+    def test_counters_follow_post_changes(self):
+        """Создание, перенос и удаление поста сдвигают счётчики."""
+        group_scope = counters.group_scope(self.group.id)
+        another_scope = counters.group_scope(self.another_group.id)
+        Follow.objects.create(user=self.follower, author=self.user)
+        follow_scope = counters.follow_scope(self.follower.id)
+        for scope, queryset in (
+            (counters.ALL, Post.objects.all()),
+            (group_scope, self.group.posts.all()),
+            (another_scope, self.another_group.posts.all()),
+            (follow_scope, Post.objects.filter(
+                author__following__user=self.follower)),
+        ):
+            counters.get_count(scope, queryset)
+        post = Post.objects.create(text='Новый пост', author=self.user,
+                                   group=self.group)
+        self.assertEqual(self.get_counter(counters.ALL), 2)
+        self.assertEqual(self.get_counter(group_scope), 2)
+        self.assertEqual(self.get_counter(follow_scope), 2)
+        post.group = self.another_group
+        post.save()
+        self.assertEqual(self.get_counter(group_scope), 1)
+        self.assertEqual(self.get_counter(another_scope), 1)
+        self.assertEqual(self.get_counter(counters.ALL), 2)
+        post.delete()
+        self.assertEqual(self.get_counter(another_scope), 0)
+        self.assertEqual(self.get_counter(counters.ALL), 1)
+
+    def test_follower_counters_on_author_change(self):
+        """Правка текста не трогает ленты подписчиков, смена автора —
+        переносит пост между ними."""
+        another = User.objects.create_user(username='Another')
+        Follow.objects.create(user=self.follower, author=self.user)
+        follow_scope = counters.follow_scope(self.follower.id)
+        counters.get_count(follow_scope, Post.objects.filter(
+            author__following__user=self.follower))
+        post = Post.objects.create(text='Пост', author=self.user)
+        self.assertEqual(self.get_counter(follow_scope), 2)
+        post.text = 'Правка'
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse([query for query in queries.captured_queries
+                          if Follow._meta.db_table in query['sql']])
+        self.assertEqual(self.get_counter(follow_scope), 2)
+        post.author = another
+        post.save()
+        self.assertEqual(self.get_counter(follow_scope), 1)
+
+    def test_follow_resets_feed_counter(self):
+        """Подписка сбрасывает счётчик ленты подписчика."""
+        scope = counters.follow_scope(self.follower.id)
+        FeedCounter.objects.create(scope=scope, value=0)
+        Follow.objects.create(user=self.follower, author=self.user)
+        self.assertFalse(FeedCounter.objects.filter(scope=scope).exists())
+
+    @override_settings(FEED_COUNT_CAP=1)
+    def test_capped_count(self):
+        """Без счётчика большая лента считается до потолка."""
+        Post.objects.create(text='Ещё пост', author=self.user)
+        self.assertEqual(
+            counters.get_count(counters.ALL, Post.objects.all()), (1, False))
+        self.assertFalse(FeedCounter.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                counters.get_count(counters.ALL, Post.objects.all()),
+                (1, False))
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(FEED_COUNT_CAP=1)
+    def test_recount_command(self):
+        """Команда заводит точные счётчики и для лент длиннее потолка."""
+        Post.objects.create(text='Ещё пост', author=self.user)
+        counters.get_count(counters.ALL, Post.objects.all())
+        call_command('recount_feed_counters', stdout=StringIO())
+        self.assertEqual(
+            counters.get_count(counters.ALL, Post.objects.all()), (2, True))
+        self.assertEqual(
+            self.get_counter(counters.author_scope(self.user.id)), 2)
+        self.assertEqual(
+            self.get_counter(counters.group_scope(self.group.id)), 1)
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..export import CURSOR_PREFIX
+from ..models import Group, Post, User
+
+NUMBER_POSTS = 7
+
+
+@override_settings(EXPORT_CHUNK_SIZE=3)
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        for number in range(NUMBER_POSTS):
+            Post.objects.create(author=cls.user, group=cls.group,
+                                text=f'Пост {number}')
+        Post.objects.create(author=User.objects.create_user(username='other'),
+                            text='Чужой пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def jsonl(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_profile_jsonl(self):
+        """Выгрузка профиля в JSONL отдаёт все посты автора по убыванию
+        даты."""
+        rows = self.jsonl(reverse('posts:profile_export',
+                                  args=(self.user.username,)))
+        self.assertEqual(
+            [row['text'] for row in rows],
+            [f'Пост {number}' for number in reversed(range(NUMBER_POSTS))])
+        self.assertEqual(rows[0]['author'], 'author')
+        self.assertEqual(rows[0]['group'], 'group')
+
+    def test_group_csv(self):
+        """Выгрузка группы в CSV начинается с заголовка."""
+        response = self.client.get(
+            reverse('posts:group_export', args=(self.group.slug,)),
+            {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(
+            b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][0], 'id')
+        self.assertEqual(len(rows), NUMBER_POSTS + 1)
+
+    @override_settings(EXPORT_TIME_BUDGET=0)
+    def test_resume_from_cursor(self):
+        """Исчерпав время, выгрузка отдаёт курсор для продолжения."""
+        url = reverse('posts:profile_export', args=(self.user.username,))
+        texts = []
+        cursor = None
+        while True:
+            rows = self.jsonl(url, **({'cursor': cursor} if cursor else {}))
+            cursor = rows[-1].get('next_cursor')
+            texts.extend(row['text'] for row in rows if 'text' in row)
+            if cursor is None:
+                break
+        self.assertEqual(
+            texts,
+            [f'Пост {number}' for number in reversed(range(NUMBER_POSTS))])
+
+    @override_settings(EXPORT_TIME_BUDGET=0)
+    def test_csv_cursor_line(self):
+        """В CSV курсор продолжения идёт последней строкой-комментарием."""
+        response = self.client.get(
+            reverse('posts:group_export', args=(self.group.slug,)),
+            {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[-1].startswith(CURSOR_PREFIX))
+
+    def test_bad_requests(self):
+        """Неизвестный формат и испорченный курсор — ошибка 400."""
+        url = reverse('posts:profile_export', args=(self.user.username,))
+        self.assertEqual(
+            self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {'cursor': 'broken'}).status_code, 400)
@@ -0,0 +1,74 @@
+from http import HTTPStatus
+
+from django.core.cache import cache
+from django.http import Http404
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import identity
+from ..forms import PostForm
+from ..models import Group, User
+
+
+class IdentityCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_found_object_cached(self):
+        """Повторный поиск группы и автора не ходит в базу."""
+        identity.get_group('group')
+        identity.get_user('author')
+        with self.assertNumQueries(0):
+            self.assertEqual(identity.get_group('group'), self.group)
+            self.assertEqual(identity.get_user('author'), self.user)
+
+    def test_private_fields_not_cached(self):
+        """В общий кэш не попадают хеш пароля и флаги прав."""
+        identity.get_user('author')
+        cached = cache.get(identity.lookup_key(User, 'author'))
+        self.assertEqual(cached, (self.user.pk, 'author', '', ''))
+        self.assertNotIn(self.user.password, cached)
+
+    def test_missing_object_cached(self):
+        """Несуществующий slug запоминается: 404 без запроса к базе."""
+        with self.assertRaises(Http404):
+            identity.get_group('missing')
+        with self.assertNumQueries(0), self.assertRaises(Http404):
+            identity.get_group('missing')
+
+    def test_save_invalidates(self):
+        """Новый и переименованный объекты видны сразу, старый slug — 404."""
+        with self.assertRaises(Http404):
+            identity.get_user('newcomer')
+        newcomer = User.objects.create_user(username='newcomer')
+        self.assertEqual(identity.get_user('newcomer'), newcomer)
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertEqual(identity.get_group('renamed').slug, 'renamed')
+        with self.assertRaises(Http404):
+            identity.get_group('group')
+
+    def test_views_use_cache(self):
+        """Ленты группы и профиля отвечают 404 для отсутствующих адресов."""
+        for url in (reverse('posts:group_list', args=['missing']),
+                    reverse('posts:profile', args=['missing'])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code,
+                                 HTTPStatus.NOT_FOUND)
+
+    def test_form_group_choices_cached(self):
+        """Список групп формы берётся из кэша и обновляется с группами."""
+        PostForm()
+        with self.assertNumQueries(0):
+            choices = list(PostForm().fields['group'].choices)
+        self.assertEqual(choices[1:], [(self.group.pk, 'Группа')])
+        other = Group.objects.create(title='Другая', slug='other',
+                                     description='Описание')
+        self.assertIn((other.pk, 'Другая'), PostForm().fields['group'].choices)
@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .. import cache as posts_cache
+from .. import invalidation
+from ..bulk import refresh_derived_data
+from ..models import Comment, Group, InvalidationEvent, Post, User
+
+
+class InvalidationBusTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        # Идентификаторы событий после отката теста переиспользуются.
+        state = mock.patch.object(invalidation, '_state', invalidation.State())
+        state.start()
+        self.addCleanup(state.stop)
+        self.received = []
+        invalidation.subscribe(self.received.extend)
+        self.addCleanup(invalidation._subscribers.remove,
+                        self.received.extend)
+        invalidation.poll(force=True)
+
+    def test_changes_published(self):
+        """Изменения моделей попадают в outbox со своими областями."""
+        post = Post.objects.create(author=self.user, group=self.group,
+                                   text='Пост')
+        Comment.objects.create(post=post, author=self.user, text='Текст')
+        invalidation.poll(force=True)
+        scopes = {event.entity: event.scopes for event in self.received}
+        self.assertIn(f'group:{self.group.pk}', scopes['post'])
+        self.assertEqual(scopes['comment'], [f'comments:{post.pk}'])
+        self.received.clear()
+        invalidation.poll(force=True)
+        self.assertEqual(self.received, [])
+
+    def test_local_cards_evicted(self):
+        """Событие убирает затронутые карточки из L1 процесса."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        invalidation.poll(force=True)
+        scopes = posts_cache.post_version_names(post)
+        posts_cache.cards_cache.set('card', 'html', tag=1, scopes=scopes)
+        posts_cache.cards_cache.promote(
+            'card', posts_cache.cards_cache.backend.get('card'))
+        post.text = 'Новый текст'
+        post.save()
+        invalidation.poll(force=True)
+        self.assertNotIn('card', posts_cache.cards_cache.l1)
+        posts_cache.cards_cache.clear_local()
+
+    def test_late_commit_read(self):
+        """Строка с меньшим id, ставшая видимой позже, не теряется."""
+        for entity in ('first', 'late', 'last'):
+            invalidation.publish(entity, 1, [entity])
+        late = InvalidationEvent.objects.get(entity='late')
+        late.delete()
+        invalidation.poll(force=True)
+        self.assertEqual([event.entity for event in self.received],
+                         ['first', 'last'])
+        late.save()
+        invalidation.poll(force=True)
+        self.assertEqual(self.received[-1].entity, 'late')
+
+    @override_settings(INVALIDATION_POLL_INTERVAL=0)
+    def test_unchanged_counter_skips_database(self):
+        """Если счётчик публикаций не сдвинулся, база не читается."""
+        invalidation.poll()
+        with self.assertNumQueries(0):
+            invalidation.poll()
+
+    def test_bulk_refresh_publishes_coarse_chunks(self):
+        """Массовый пересчёт публикует версии авторов порциями,
+        а не по имени на каждый пост."""
+        posts = [Post.objects.create(author=self.user, text=f'Пост {index}')
+                 for index in range(3)]
+        invalidation.poll(force=True)
+        self.received.clear()
+        refresh_derived_data(user_ids=[self.user.pk],
+                             post_ids=[post.pk for post in posts],
+                             chunk_size=2)
+        invalidation.poll(force=True)
+        self.assertTrue(all(len(event.scopes) <= 2
+                            for event in self.received))
+        scopes = {scope for event in self.received for scope in event.scopes}
+        self.assertEqual(scopes, {posts_cache.FEED_VERSION,
+                                  f'user:{self.user.pk}',
+                                  f'follows:{self.user.pk}'})
+
+    @override_settings(INVALIDATION_RETENTION=0)
+    def test_old_events_purged(self):
+        """Старые события удаляются из таблицы."""
+        Post.objects.create(author=self.user, text='Пост')
+        invalidation.purge()
+        self.assertFalse(InvalidationEvent.objects.exists())
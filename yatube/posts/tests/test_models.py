@@ -1,7 +1,11 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.conf import settings
 
-from ..models import Group, Post, User
+from ..models import Follow, Group, Post, User, UserStats
+from ..stats import get_user_stats
 
 
 class PostModelTest(TestCase):
@@ -25,3 +29,40 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         self.assertEqual(post.text[:settings.THIRTY], post.__str__())
         self.assertEqual(group.title, group.__str__())
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        Post.objects.create(author=cls.author, text='Тестовый пост')
+
+    def test_stats_follow_changes(self):
+        """Счётчики пользователя меняются вместе с постами и подписками."""
+        self.assertEqual(get_user_stats(self.author.id).posts_count, 1)
+        get_user_stats(self.follower.id)
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Ещё пост')
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (2, 1))
+        self.assertEqual(
+            UserStats.objects.get(user=self.follower).following_count, 1)
+        follow.delete()
+        post.delete()
+        stats.refresh_from_db()
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (1, 0))
+
+    def test_recount_command(self):
+        """Команда пересчитывает статистику всех пользователей."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        UserStats.objects.update(posts_count=100)
+        call_command('recount_user_stats', chunk_size=1, stdout=StringIO())
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (1, 1))
+        self.assertEqual(
+            UserStats.objects.get(user=self.follower).following_count, 1)
@@ -0,0 +1,171 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from .. import urls
+from ..models import Comment, Follow, Group, Post, User
+
+# Обход таблицы или индекса целиком; для индекса — его имя.
+SCAN = re.compile(
+    r'^SCAN (?:TABLE )?(\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+ORDER_BY = re.compile(r'ORDER BY (.+?)(?: LIMIT\b|$)')
+COLUMN = re.compile(r'"(\w+)"(?: (?:ASC|DESC))?$')
+# Справочники, которые читаются целиком ради списков выбора в формах.
+WHOLE_TABLES = {'posts_group'}
+
+
+class QueryPlanTest(TestCase):
+    """Запросы страниц не должны читать таблицы целиком
+    и сортировать результат во временном B-дереве. Проверяется
+    каждый адрес posts.urls."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for index in range(15):
+            post = Post.objects.create(text=f'Пост {index}',
+                                       author=cls.author, group=cls.group)
+            Comment.objects.create(post=post, author=cls.user,
+                                   text=f'Комментарий {index}')
+        cls.post = post
+        cls.covered = set()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        missing = {pattern.name for pattern in urls.urlpatterns} - cls.covered
+        assert not missing, f'Нет проверки планов для {sorted(missing)}'
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def order_columns(self, sql):
+        """Столбцы ORDER BY внешнего запроса."""
+        orders = ORDER_BY.findall(sql)
+        if not orders:
+            return []
+        return [COLUMN.search(item.strip()).group(1)
+                for item in orders[-1].split(',')]
+
+    def index_columns(self, index):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA index_info("{index}")')
+            return [row[2] for row in cursor.fetchall()]
+
+    def unbounded_scan(self, sql, detail):
+        """Обход допустим только по индексу, который совпадает
+        с ORDER BY запроса: строки идут уже отсортированными, и чтение
+        кончается на нужной странице. Исключение — маленький справочник,
+        который читается целиком."""
+        match = SCAN.match(detail)
+        if match is None or match.group(1) in WHOLE_TABLES:
+            return False
+        order = self.order_columns(sql)
+        if match.group(2) is None or not order:
+            return True
+        return self.index_columns(match.group(2))[:len(order)] != order
+
+    def assert_plans(self, url, data=None, method='get', warm_up=True):
+        # Первый запрос заводит счётчики лент, второй проверяем.
+        # Кэш очищен, чтобы запросы действительно дошли до базы.
+        self.covered.add(resolve(url).url_name)
+        request = getattr(self.client, method)
+        if warm_up:
+            request(url, data)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = request(url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    with self.subTest(url=url, sql=sql, plan=detail):
+                        self.assertFalse(self.unbounded_scan(sql, detail))
+                        self.assertIsNone(TEMP_SORT.search(detail))
+
+    def test_feed_plans(self):
+        """Ленты читаются по индексам."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            first_page = self.client.get(url).context['page_obj']
+            self.assert_plans(url)
+            self.assert_plans(url, {'page': 2})
+            self.assert_plans(url, {'cursor': str(first_page.next_cursor)})
+
+    def test_merged_follow_plans(self):
+        """Лента с популярным автором читается диапазонами индексов."""
+        popular = User.objects.create_user(username='Popular')
+        Follow.objects.create(user=self.user, author=popular)
+        for index in range(15):
+            Post.objects.create(text=f'Популярный пост {index}',
+                                author=popular)
+        Post.objects.filter(author=popular).update(fanned_out=False)
+        Follow.objects.filter(author=popular).update(pulled=True)
+        url = reverse('posts:follow_index')
+        first_page = self.client.get(url).context['page_obj']
+        self.assert_plans(url)
+        self.assert_plans(url, {'cursor': str(first_page.next_cursor)})
+
+    def test_export_and_search_plans(self):
+        """Выгрузки и поиск читаются по индексам."""
+        self.assert_plans(
+            reverse('posts:profile_export', args=(self.author.username,)))
+        self.assert_plans(
+            reverse('posts:group_export', args=(self.group.slug,)),
+            {'format': 'csv'})
+        self.assert_plans(reverse('posts:post_search'), {
+            'q': 'Пост', 'group': self.group.slug,
+            'author': self.author.username})
+
+    def test_form_plans(self):
+        """Формы и действия читают только нужные строки."""
+        edit_url = reverse('posts:post_edit', args=(self.post.id,))
+        self.client.force_login(self.author)
+        self.assert_plans(reverse('posts:create'))
+        self.assert_plans(reverse('posts:create'), {'text': 'Новый пост'},
+                          method='post')
+        self.assert_plans(edit_url)
+        self.assert_plans(edit_url, {'text': 'Правка'}, method='post')
+        self.assert_plans(
+            reverse('posts:add_comment', args=(self.post.id,)),
+            {'text': 'Комментарий'}, method='post')
+
+    def test_follow_action_plans(self):
+        """Подписка и отписка находят автора и подписку по индексам."""
+        self.assert_plans(
+            reverse('posts:profile_unfollow', args=(self.author.username,)),
+            warm_up=False)
+        self.assert_plans(
+            reverse('posts:profile_follow', args=(self.author.username,)),
+            warm_up=False)
+
+    def test_post_detail_plans(self):
+        """Пост и его комментарии читаются по индексам."""
+        self.assert_plans(reverse('posts:post_detail', args=(self.post.id,)))
+        self.assert_plans(
+            reverse('posts:post_comments', args=(self.post.id,)))
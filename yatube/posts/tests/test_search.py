@@ -0,0 +1,101 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Group, Post, User
+from ..search import FTS_TABLE
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group,
+            text='Утренняя прогулка по набережной <b>реки</b>')
+        Post.objects.create(author=cls.other,
+                            text='Вечерняя прогулка по парку')
+        Post.objects.create(author=cls.other, text='Рецепт пирога')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        response = self.client.get(reverse('posts:post_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def found(self, **params):
+        page_obj = self.search(**params).context['page_obj']
+        return {post.text for post in page_obj}
+
+    def test_search_finds_words_and_prefixes(self):
+        """Поиск находит посты по словам и по началу слова."""
+        self.assertEqual(len(self.found(q='прогулка')), 2)
+        self.assertEqual(self.found(q='пир'), {'Рецепт пирога'})
+        self.assertEqual(self.found(q='прогулка пирога'), set())
+
+    def test_filters(self):
+        """Результаты фильтруются по группе и автору."""
+        self.assertEqual(self.found(q='прогулка', group='group'),
+                         {self.post.text})
+        self.assertEqual(self.found(q='прогулка', author='other'),
+                         {'Вечерняя прогулка по парку'})
+        self.assertEqual(self.found(q='прогулка', author='nobody'), set())
+
+    def test_highlight_escapes_text(self):
+        """Совпадения выделяются, а HTML из текста поста экранируется."""
+        content = self.search(q='реки').content.decode()
+        self.assertIn('&lt;b&gt;<mark>реки</mark>&lt;/b&gt;', content)
+
+    def test_operators_in_query_are_plain_words(self):
+        """Синтаксис FTS5 во вводе не приводит к ошибке."""
+        self.assertEqual(self.found(q='прогулка OR "NEAR(*'), set())
+        self.assertIsNone(self.search(q='!!!').context['page_obj'])
+
+    @override_settings(POSTS_ON_PAGE=1)
+    def test_keyset_pagination(self):
+        """Курсоры ведут по страницам без повторов и в обе стороны."""
+        first = self.search(q='прогулка').context['page_obj']
+        second = self.search(
+            q='прогулка', cursor=first.next_cursor).context['page_obj']
+        self.assertFalse(second.has_next())
+        self.assertNotEqual(first[0].pk, second[0].pk)
+        back = self.search(
+            q='прогулка', cursor=second.previous_cursor).context['page_obj']
+        self.assertEqual(back[0].pk, first[0].pk)
+
+    def test_index_follows_changes(self):
+        """Триггеры обновляют индекс при изменении и удалении поста."""
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        self.assertEqual(self.found(q='набережной'), set())
+        self.assertEqual(self.found(q='новый'), {'Новый текст'})
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(self.found(q='новый'), set())
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'прогулка'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_rebuild_command(self):
+        """Команда пересобирает индекс с нуля."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(self.found(q='прогулка'), set())
+        call_command('rebuild_search_index', chunk_size=1, workers=1,
+                     stdout=StringIO())
+        self.assertEqual(len(self.found(q='прогулка')), 2)
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from .. import tasks
+from ..models import Follow, Post, TimelineEntry, User
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=True)
+class BackgroundTasksTest(TransactionTestCase):
+    def drain(self):
+        # Дожидаемся всех отправленных задач; следующий вызов
+        # заведёт новый пул.
+        tasks.get_executor().shutdown(wait=True)
+        tasks._executor = None
+
+    def test_runs_after_commit_in_pool(self):
+        """Задача уходит в пул только после коммита транзакции."""
+        calls = []
+        with transaction.atomic():
+            tasks.run_in_background(calls.append, 'done')
+            self.assertEqual(calls, [])
+        self.drain()
+        self.assertEqual(calls, ['done'])
+
+    def test_rolled_back_task_dropped(self):
+        """Задача откатившейся транзакции не выполняется."""
+        calls = []
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            tasks.run_in_background(calls.append, 'done')
+            raise RuntimeError
+        self.drain()
+        self.assertEqual(calls, [])
+
+    def test_errors_logged(self):
+        """Ошибка задачи пишется в лог и не роняет пул."""
+        def fail():
+            raise ValueError
+
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            tasks.run_in_background(fail)
+            self.drain()
+
+    def test_fan_out_in_background(self):
+        """Новый пост раскладывается по лентам фоновой задачей."""
+        author = User.objects.create_user(username='author')
+        follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=follower, author=author)
+        # Тестовая база в памяти с общим кэшем блокирует таблицы
+        # целиком: не пишем, пока работает предыдущая задача.
+        self.drain()
+        post = Post.objects.create(text='Пост', author=author)
+        self.drain()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follower, post=post).exists())
@@ -0,0 +1,140 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .. import cache as posts_cache
+from .. import thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+GEOMETRY, OPTIONS = settings.POST_THUMBNAILS[0]
+
+
+# Без вариантов для srcset лента показывает миниатюры sorl.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_VARIANT_FORMATS=())
+class ThumbnailPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        thumbnails.local_cache().clear()
+        patcher = mock.patch.object(thumbnails, 'run_in_background')
+        self.enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_post(self, name='small.gif'):
+        return Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=SimpleUploadedFile(name, SMALL_GIF,
+                                     content_type='image/gif'))
+
+    def test_saved_image_is_enqueued(self):
+        """Сохранение картинки ставит в очередь все размеры один раз."""
+        post = self.create_post()
+        self.assertEqual(self.enqueue.call_count,
+                         len(settings.POST_THUMBNAILS))
+        self.enqueue.assert_called_with(
+            thumbnails.generate, post.image.name, GEOMETRY, OPTIONS, post.pk)
+        post.text = 'Другой текст'
+        post.save()
+        self.assertEqual(self.enqueue.call_count,
+                         len(settings.POST_THUMBNAILS))
+
+    def test_lock_dedupes_work(self):
+        """Пока миниатюра создаётся, повторно она в очередь не ставится."""
+        post = self.create_post()
+        self.assertFalse(
+            thumbnails.schedule(post.image.name, GEOMETRY, OPTIONS))
+        self.assertEqual(self.enqueue.call_count, 1)
+
+    def test_lock_released_after_generation(self):
+        """После попытки создания блокировка снимается, даже при ошибке."""
+        post = self.create_post()
+        with mock.patch.object(default.backend, 'generate',
+                               side_effect=OSError):
+            thumbnails.generate(post.image.name, GEOMETRY, OPTIONS, post.pk)
+        self.assertTrue(
+            thumbnails.schedule(post.image.name, GEOMETRY, OPTIONS))
+
+    def test_card_falls_back_to_original(self):
+        """Пока миниатюры нет, карточка показывает исходную картинку."""
+        post = self.create_post()
+        cards = posts_cache.render_cards(
+            Post.objects.select_related('author', 'group'),
+            'posts/includes/post_list.html', {})
+        self.assertIn(f'src="{post.image.url}"', cards[0])
+
+    def test_generation_refreshes_card(self):
+        """Готовая миниатюра сдвигает версию поста для перерисовки."""
+        post = self.create_post()
+        version = posts_cache.get_version(f'post:{post.pk}')
+        with mock.patch.object(default.backend, 'generate'):
+            thumbnails.generate(post.image.name, GEOMETRY, OPTIONS)
+        self.assertNotEqual(
+            posts_cache.get_version(f'post:{post.pk}'), version)
+
+    def store_thumbnail(self, post):
+        """Запись о готовой миниатюре, как её оставляет sorl."""
+        source = ImageFile(post.image)
+        key = default.backend.thumbnail_key(source, GEOMETRY, OPTIONS)
+        thumbnail = ImageFile(f'cache/{post.pk}.jpg', default.storage)
+        thumbnail.set_size((960, 339))
+        default.kvstore._set(key, thumbnail)
+        return thumbnail
+
+    def test_page_resolved_in_one_batch(self):
+        """Миниатюры страницы ищутся одним запросом, повторно — в LRU."""
+        posts = [self.create_post(f'{number}.gif') for number in range(3)]
+        stored = [self.store_thumbnail(post) for post in posts[:2]]
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.attach(posts)
+        self.assertEqual(
+            [post.thumbnails[GEOMETRY].name for post in posts],
+            [stored[0].name, stored[1].name, posts[2].image.name])
+        with self.assertNumQueries(0):
+            thumbnails.attach(posts[:2])
+
+    def test_render_passes_post_id(self):
+        """Миниатюра, поставленная в очередь при рендере, знает свой пост
+        и не ищет его по имени картинки."""
+        post = self.create_post()
+        cache.clear()
+        thumbnails.attach([post])
+        self.enqueue.assert_called_with(
+            thumbnails.generate, post.image.name, GEOMETRY, OPTIONS, post.pk)
+        with mock.patch.object(default.backend, 'generate'), \
+                self.assertNumQueries(0):
+            thumbnails.generate(post.image.name, GEOMETRY, OPTIONS, post.pk)
+
+    def test_local_cache_is_bounded(self):
+        """LRU процесса вытесняет давно не нужные миниатюры."""
+        lru = thumbnails.LocalLRU(2)
+        lru.get_many(['a', 'b'], lambda keys: {key: key for key in keys})
+        lru.get_many(['a', 'c'], lambda keys: {key: key for key in keys})
+        self.assertEqual(list(lru.items), ['a', 'c'])
@@ -0,0 +1,118 @@
+import io
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .. import cache as posts_cache
+from .. import uploads
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+ORIENTATION = 0x0112
+ROTATED_90 = 6
+
+
+def photo(name='photo.jpg', size=(300, 200)):
+    """JPEG с EXIF: камера записала, что кадр нужно повернуть."""
+    exif = Image.Exif()
+    exif[ORIENTATION] = ROTATED_90
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, UPLOAD_IMAGE_MAX_SIZE=100,
+                   IMAGE_VARIANT_WIDTHS=(40, 960),
+                   IMAGE_VARIANT_FORMATS=('WEBP', 'JPEG'))
+class UploadProcessingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_photo_is_reencoded(self):
+        """Фото уменьшается, поворачивается по EXIF и теряет метаданные."""
+        post = Post.objects.create(author=self.user, text='Фото',
+                                   image=photo())
+        original = post.image.name
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, original)
+        self.assertFalse(default_storage.exists(original))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, settings.UPLOAD_IMAGE_FORMATS[0])
+            self.assertEqual(image.size, (67, 100))
+            self.assertFalse(image.getexif())
+
+    def test_replaced_image_is_not_overwritten(self):
+        """Результат не подменяет картинку, которую уже сменили."""
+        post = Post.objects.create(author=self.user, text='Фото',
+                                   image=photo())
+        post.refresh_from_db()
+        current = post.image.name
+        name = default_storage.save('posts/old.jpg', photo())
+        uploads.process_post_image(post.pk, name)
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, current)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_variants_manifest(self):
+        """Варианты создаются один раз и описаны в манифесте поста;
+        шире исходной картинки они не бывают."""
+        post = Post.objects.create(author=self.user, text='Фото',
+                                   image=photo())
+        post.refresh_from_db()
+        manifest = post.variants
+        self.assertEqual([source['type'] for source in manifest['sources']],
+                         ['image/webp', 'image/jpeg'])
+        for source in manifest['sources']:
+            self.assertEqual([width for _, width in source['files']],
+                             [40, 67])
+            for name, width in source['files']:
+                with Image.open(default_storage.path(name)) as image:
+                    self.assertEqual(image.width, width)
+
+    def test_card_uses_srcset(self):
+        """Карточка ленты отдаёт srcset по манифесту и ленивую загрузку."""
+        post = Post.objects.create(author=self.user, text='Фото',
+                                   image=photo())
+        post.refresh_from_db()
+        card = posts_cache.render_cards(
+            [post], 'posts/includes/post_list.html')[0]
+        name, width = post.variants['sources'][0]['files'][-1]
+        self.assertIn(f'{default_storage.url(name)} {width}w', card)
+        self.assertIn('type="image/webp"', card)
+        self.assertIn('loading="lazy"', card)
+
+    def test_new_image_replaces_variants(self):
+        """Смена картинки удаляет варианты старой и создаёт новые."""
+        post = Post.objects.create(author=self.user, text='Фото',
+                                   image=photo())
+        post.refresh_from_db()
+        old_files = [name for source in post.variants['sources']
+                     for name, _ in source['files']]
+        post.image = photo('other.jpg')
+        post.save()
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.startswith('posts/other'))
+        self.assertFalse(any(default_storage.exists(name)
+                             for name in old_files))
+        self.assertTrue(all(
+            default_storage.exists(name)
+            for source in post.variants['sources']
+            for name, _ in source['files']))
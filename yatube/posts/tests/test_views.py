@@ -1,4 +1,6 @@
 import tempfile
+from http import HTTPStatus
+from io import StringIO
 
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
@@ -6,9 +8,11 @@ from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
 
 from ..forms import PostForm
-from ..models import Follow, Post, Group, User
+from ..models import Follow, Post, Group, TimelineEntry, User
+from ..utils import encode_cursor
 
 NUMBER_OF_PAGINATOR_POSTS = 20
 
@@ -70,6 +74,7 @@ class PostModelTest(TestCase):
         self.assertEqual(page_obj.image, self.post.image)
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -147,15 +152,23 @@ class PostModelTest(TestCase):
     def test_index_cache(self):
         """Тест кэша"""
         cache_content = self.client.get(reverse('posts:index')).content
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        cache_content_again = self.client.get(reverse('posts:index')).content
+        self.assertEqual(cache_content, cache_content_again)
+        cache.clear()
+        cache_after_clear = self.client.get(reverse('posts:index')).content
+        self.assertNotEqual(cache_content, cache_after_clear)
+
+    def test_index_cache_invalidation(self):
+        """Новый пост сразу сбрасывает кэш главной страницы."""
+        cache_content = self.client.get(reverse('posts:index')).content
         Post.objects.create(
             text='Текст для проверки кэша',
             author=self.user
         )
-        cache_before_20sec = self.client.get(reverse('posts:index')).content
-        self.assertEqual(cache_content, cache_before_20sec)
-        cache.clear()
-        cache_after_20sec = self.client.get(reverse('posts:index')).content
-        self.assertNotEqual(cache_content, cache_after_20sec)
+        new_content = self.client.get(reverse('posts:index')).content
+        self.assertNotEqual(cache_content, new_content)
+        self.assertIn('Текст для проверки кэша', new_content.decode())
 
     def test_authorized_user_follow(self):
         """Авторизированный пользователь может ПОДПИСАТЬСЯ на автора"""
@@ -247,3 +260,170 @@ class PaginatorViewTest(TestCase):
                         self.assertEqual(
                             len(response.context['page_obj']),
                             quantity)
+
+    def test_paginator_cursor(self):
+        """Курсорные страницы продолжают ленту без повторов и пропусков."""
+        url = reverse('posts:index')
+        first_page = self.authorized_client.get(url).context['page_obj']
+        response = self.authorized_client.get(
+            url, {'cursor': str(first_page.next_cursor)})
+        second_page = response.context['page_obj']
+        self.assertTrue(second_page.is_cursor_page)
+        self.assertEqual(second_page.number, 2)
+        self.assertEqual(len(second_page),
+                         NUMBER_POSTS - settings.POSTS_ON_PAGE)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            {post.id for post in first_page} | {post.id for post in
+                                                second_page},
+            set(Post.objects.values_list('id', flat=True)))
+        response = self.authorized_client.get(
+            url, {'cursor': second_page.previous_cursor})
+        previous_page = response.context['page_obj']
+        self.assertEqual(previous_page.number, 1)
+        self.assertFalse(previous_page.has_previous())
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_paginator_invalid_cursor(self):
+        """Некорректный курсор открывает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_ON_PAGE)
+
+    @override_settings(FEED_COUNT_CAP=settings.POSTS_ON_PAGE // 2)
+    def test_paginator_estimated_count(self):
+        """При приблизительном числе постов ?page=N не зажимается
+        до потолка, а отдаёт N-ю страницу с курсорной навигацией."""
+        cache.clear()
+        url = reverse('posts:index')
+        page = self.authorized_client.get(url, {'page': 2}).context[
+            'page_obj']
+        self.assertTrue(page.is_cursor_page)
+        self.assertEqual(page.number, 2)
+        self.assertEqual(len(page), NUMBER_POSTS - settings.POSTS_ON_PAGE)
+        self.assertTrue(page.has_previous())
+        self.assertFalse(page.has_next())
+        page = self.authorized_client.get(url, {'page': 50}).context[
+            'page_obj']
+        self.assertEqual(page.number, 1)
+        self.assertEqual(len(page), settings.POSTS_ON_PAGE)
+
+    def test_paginator_malformed_cursor(self):
+        """Курсор с ключами неверного типа открывает первую страницу."""
+        post = Post.objects.first()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', args=(post.id,)),
+            reverse('posts:post_comments', args=(post.id,)),
+        )
+        cursors = (
+            encode_cursor('n', 2, ['abc', 1]),
+            encode_cursor('n', 2, [{'a': 1}, 1]),
+            encode_cursor('n', 2, [1, 1]),
+            encode_cursor('n', 2, [post.pub_date, True]),
+            encode_cursor('n', 2, [post.pub_date]),
+        )
+        for url in urls:
+            for cursor in cursors:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.authorized_client.get(
+                        url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.authorized_client.get(
+            reverse('posts:profile_export', args=(self.user.username,)),
+            {'cursor': cursors[0]})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.authorized_client.get(reverse('posts:index'),
+                                              {'cursor': cursors[0]})
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_ON_PAGE)
+
+
+class FollowTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.old_post = Post.objects.create(text='Старый пост',
+                                           author=cls.author)
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+
+    def get_feed(self):
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_backfill_and_fan_out(self):
+        """Подписка дополняет ленту, новые посты раскладываются по ней."""
+        self.follower_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+        self.assertEqual(self.get_feed(), [self.old_post])
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertEqual(self.get_feed(), [])
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists())
+
+    def test_unfollowed_entries_skipped_and_reconciled(self):
+        """Записи автора без подписки не попадают в ленту, а сверка
+        удаляет их и дописывает недостающие."""
+        other = User.objects.create_user(username='Other')
+        other_post = Post.objects.create(text='Чужой пост', author=other)
+        TimelineEntry.objects.create(
+            user=self.follower, post=self.old_post, author=self.author,
+            pub_date=self.old_post.pub_date)
+        Follow.objects.bulk_create([Follow(user=self.follower, author=other)])
+        self.assertEqual(self.get_feed(), [])
+        call_command('reconcile_timelines', stdout=StringIO())
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.follower)
+                 .values_list('post_id', flat=True)), [other_post.id])
+        self.assertEqual(self.get_feed(), [other_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_merged_on_read(self):
+        """Посты популярных авторов подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(text='Пост популярного автора',
+                                       author=self.author)
+        new_post.refresh_from_db()
+        self.assertFalse(new_post.fanned_out)
+        self.assertFalse(TimelineEntry.objects.filter(post=new_post).exists())
+        self.assertTrue(Follow.objects.get(user=self.follower).pulled)
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+
+    def test_merged_feed_pages(self):
+        """Лента с популярным автором листается курсором без пропусков
+        и повторов, в порядке дат."""
+        popular = User.objects.create_user(username='Popular')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=popular)
+        for index in range(settings.POSTS_ON_PAGE):
+            Post.objects.create(text=f'Пост {index}', author=self.author)
+            Post.objects.create(text=f'Пост {index}', author=popular)
+        Post.objects.filter(author=popular).update(fanned_out=False)
+        Follow.objects.filter(author=popular).update(pulled=True)
+        expected = list(Post.objects.filter(
+            author__in=(self.author, popular)).order_by('-pub_date', '-id'))
+        url = reverse('posts:follow_index')
+        pages = []
+        page = self.follower_client.get(url).context['page_obj']
+        pages.append(list(page))
+        while page.has_next():
+            page = self.follower_client.get(
+                url, {'cursor': page.next_cursor}).context['page_obj']
+            pages.append(list(page))
+        self.assertEqual([post for rows in pages for post in rows], expected)
+        previous = self.follower_client.get(
+            url, {'cursor': page.previous_cursor}).context['page_obj']
+        self.assertEqual(list(previous), pages[-2])
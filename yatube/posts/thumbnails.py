@@ -0,0 +1,229 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDbKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import metrics
+
+from . import cache as feed_cache
+from .tasks import run_in_background
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRU:
+    """Ограниченный LRU-кэш процесса перед хранилищем ключей sorl.
+
+    Хранит только найденные миниатюры: готовая миниатюра не меняется,
+    её имя зависит от файла-источника, а отсутствующую нужно
+    перепроверять, пока её не создаст фоновая задача.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys, load):
+        found = {}
+        missing = set()
+        with self.lock:
+            for key in keys:
+                if key in self.items:
+                    self.items.move_to_end(key)
+                    found[key] = self.items[key]
+                else:
+                    missing.add(key)
+        if not missing:
+            return found
+        loaded = {key: value for key, value in load(missing).items()
+                  if value is not None}
+        found.update(loaded)
+        with self.lock:
+            self.items.update(loaded)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return found
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+_local = None
+
+
+def local_cache():
+    global _local
+    if _local is None:
+        _local = LocalLRU(settings.THUMBNAIL_LRU_SIZE)
+    return _local
+
+
+def load_stored(keys):
+    """Записи хранилища ключей sorl для нескольких миниатюр сразу:
+    один get_many к кэшу и один запрос к базе на промахи."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDbKVStore):
+        return {key: kvstore._get(key) for key in keys}
+    raw_keys = {add_prefix(key): key for key in keys}
+    cached = kvstore.cache.get_many(list(raw_keys))
+    values = {raw_key: value for raw_key, value in cached.items()
+              if value != EMPTY_VALUE}
+    missing = [raw_key for raw_key in raw_keys if raw_key not in cached]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        kvstore.cache.set_many(
+            {raw_key: stored.get(raw_key, EMPTY_VALUE)
+             for raw_key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {raw_keys[raw_key]: deserialize_image_file(value)
+            for raw_key, value in values.items()}
+
+
+def lock_key(name, geometry, options):
+    digest = hashlib.md5(
+        f'{name}:{geometry}:{sorted(options.items())}'.encode()).hexdigest()
+    return f'thumbnail-lock:{digest}'
+
+
+def generate(name, geometry, options, post_id=None):
+    """Создаёт миниатюру и сдвигает версию поста, чтобы карточки
+    с исходной картинкой вместо миниатюры перерисовались. Без post_id
+    пост ищется по индексу post_image."""
+    try:
+        default.backend.generate(name, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s %s', name, geometry)
+        return
+    finally:
+        cache.delete(lock_key(name, geometry, options))
+    if post_id is None:
+        from .models import Post
+        post_id = Post.objects.filter(image=name).values_list(
+            'pk', flat=True).first()
+    if post_id is not None:
+        feed_cache.bump_version(f'post:{post_id}')
+
+
+def schedule(name, geometry, options, post_id=None):
+    """Ставит создание миниатюры в очередь, если его ещё никто не делает.
+
+    Блокировка — cache.add: из параллельных запросов и сохранений
+    задачу ставит только первый. Если воркер не освободил её,
+    она истечёт через THUMBNAIL_LOCK_TIMEOUT.
+    """
+    if not cache.add(lock_key(name, geometry, options), True,
+                     settings.THUMBNAIL_LOCK_TIMEOUT):
+        return False
+    run_in_background(generate, name, geometry, options, post_id)
+    return True
+
+
+def pregenerate(name, post_id):
+    """Миниатюры всех размеров из POST_THUMBNAILS для картинки поста."""
+    for geometry, options in settings.POST_THUMBNAILS:
+        schedule(name, geometry, options, post_id)
+
+
+class PregeneratingBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не создаёт миниатюру во время рендера.
+
+    Готовая миниатюра берётся из хранилища ключей sorl; если её ещё
+    нет, создание ставится в очередь, а шаблон получает исходную
+    картинку. Сами миниатюры создаёт generate(). Опция post_id
+    передаёт ему пост картинки.
+    """
+
+    def generate(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def thumbnail_key(self, source, geometry_string, options):
+        """Ключ миниатюры в хранилище sorl — так же, как его считает
+        ThumbnailBackend.get_thumbnail(), но без обращения к хранилищу."""
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage).key
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        post_id = options.pop('post_id', None)
+        source = ImageFile(file_)
+        found = get_or_schedule([source], geometry_string, options,
+                                {source.name: post_id})
+        return found.get(source.name) or source
+
+
+def resolve(sources, geometry, options):
+    """Готовые миниатюры для нескольких картинок: {имя картинки: ImageFile}.
+
+    Сначала LRU процесса, промахи — одним пакетом из хранилища sorl.
+    """
+    keys = {default.backend.thumbnail_key(source, geometry, options):
+            source.name for source in sources}
+    found = local_cache().get_many(keys, load_stored)
+    return {keys[key]: thumbnail for key, thumbnail in found.items()}
+
+
+def get_or_schedule(sources, geometry, options, post_ids=None):
+    """Как resolve(), но недостающие миниатюры ставятся в очередь;
+    post_ids — {имя картинки: id поста}."""
+    post_ids = post_ids or {}
+    found = resolve(sources, geometry, options)
+    scheduled = [source for source in sources if source.name not in found
+                 and schedule(source.name, geometry, options,
+                              post_ids.get(source.name))]
+    if scheduled and not settings.BACKGROUND_TASKS_ASYNC:
+        # Без фоновых задач миниатюры уже созданы в schedule().
+        found.update(resolve(scheduled, geometry, options))
+    return found
+
+
+def attach(posts):
+    """Миниатюры всех размеров для постов страницы разом.
+
+    post.thumbnails — {геометрия: ImageFile}; пока миниатюры нет,
+    там исходная картинка. Посты с вариантами для srcset пропускаются.
+    """
+    start = time.perf_counter()
+    posts = [post for post in posts
+             if post.image and not post.image_variants]
+    sources = {post.image.name: ImageFile(post.image) for post in posts}
+    post_ids = {post.image.name: post.pk for post in posts}
+    for post in posts:
+        post.thumbnails = {}
+    for geometry, options in settings.POST_THUMBNAILS:
+        found = get_or_schedule(list(sources.values()), geometry, options,
+                                post_ids)
+        for post in posts:
+            post.thumbnails[geometry] = (found.get(post.image.name)
+                                         or sources[post.image.name])
+    if posts:
+        metrics.observe(metrics.TEMPLATE_DURATION,
+                        time.perf_counter() - start,
+                        template=metrics.THUMBNAIL_TEMPLATE)
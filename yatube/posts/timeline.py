@@ -0,0 +1,224 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+
+from . import counters
+from .models import Follow, Post, TimelineEntry, UserStats
+from .stats import get_user_stats
+from .utils import CursorPaginator, get_merged_page, get_page_context
+
+TIMELINE_KEYS = ('pub_date', 'post_id')
+
+
+def bulk_insert(entries):
+    entries = iter(entries)
+    batch_size = settings.TIMELINE_BATCH_SIZE
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def has_many_followers(author_id):
+    return (get_user_stats(author_id).followers_count
+            > settings.TIMELINE_FANOUT_LIMIT)
+
+
+def mark_pulled(author_ids):
+    """Помечает подписки на авторов, чьи посты подмешиваются при чтении.
+    Старые посты так и остаются вне лент, поэтому пометку снимает
+    только reconcile_timelines()."""
+    Follow.objects.filter(author_id__in=author_ids, pulled=False).update(
+        pulled=True)
+
+
+def fan_out_post(post_id):
+    """Раскладывает пост по лентам подписчиков автора.
+
+    Посты авторов с большим числом подписчиков не раскладываются:
+    они помечаются fanned_out=False и подмешиваются при чтении.
+    """
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'pub_date').first()
+    if post is None:
+        return
+    if has_many_followers(post['author_id']):
+        Post.objects.filter(pk=post_id).update(fanned_out=False)
+        mark_pulled([post['author_id']])
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post['author_id']).values_list('user_id', flat=True)
+    bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, **post)
+        for user_id in follower_ids.iterator()
+    )
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту подписчика уже разосланные посты автора
+    и помечает подписку, если часть постов подмешивается при чтении."""
+    if Post.objects.filter(author_id=author_id, fanned_out=False).exists():
+        Follow.objects.filter(user_id=user_id, author_id=author_id).update(
+            pulled=True)
+    posts = Post.objects.filter(
+        author_id=author_id, fanned_out=True).values_list('id', 'pub_date')
+    bulk_insert(
+        TimelineEntry(user_id=user_id, author_id=author_id,
+                      post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def rebuild_timelines(author_ids, since_post_id=None, post_ids=()):
+    """Раскладывает посты авторов по лентам их подписчиков.
+
+    Нужна после массовой загрузки, которая обходит сигналы, поэтому
+    пишет одним INSERT ... SELECT на порцию авторов, а не построчно.
+    since_post_id ограничивает работу постами с большим id — только
+    что загруженными, — и постами post_ids с явными id. Повторный
+    запуск безопасен: существующие записи пропускаются. Статистика
+    авторов к этому моменту должна быть пересчитана.
+    """
+    posts = Post.objects.all()
+    if since_post_id is not None:
+        posts = posts.filter(Q(pk__gt=since_post_id) | Q(pk__in=post_ids))
+    author_ids = iter(author_ids)
+    while True:
+        chunk = list(islice(author_ids, settings.TIMELINE_BATCH_SIZE))
+        if not chunk:
+            return
+        popular = list(UserStats.objects.filter(
+            user_id__in=chunk,
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('user_id', flat=True))
+        posts.filter(author_id__in=popular).update(fanned_out=False)
+        mark_pulled(popular)
+        if since_post_id is None:
+            TimelineEntry.objects.filter(author_id__in=popular).delete()
+        chunk = [author_id for author_id in chunk if author_id not in popular]
+        posts.filter(author_id__in=chunk, fanned_out=False).update(
+            fanned_out=True)
+        if chunk:
+            insert_timeline_entries(chunk, since_post_id or 0, post_ids)
+
+
+def insert_timeline_entries(author_ids, since_post_id=0, post_ids=()):
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    new_posts = 'post.id > %s'
+    if post_ids:
+        new_posts = '({} OR post.id IN ({}))'.format(
+            new_posts, ', '.join(['%s'] * len(post_ids)))
+    sql = f"""
+        INSERT INTO {TimelineEntry._meta.db_table}
+            (user_id, post_id, author_id, pub_date)
+        SELECT follow.user_id, post.id, post.author_id, post.pub_date
+        FROM {Follow._meta.db_table} follow
+        JOIN {Post._meta.db_table} post ON post.author_id = follow.author_id
+        WHERE follow.author_id IN ({placeholders}) AND {new_posts}
+        AND NOT EXISTS (
+            SELECT 1 FROM {TimelineEntry._meta.db_table} entry
+            WHERE entry.user_id = follow.user_id AND entry.post_id = post.id
+        )
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*author_ids, since_post_id, *post_ids])
+
+
+def remove_from_timeline(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def delete_unfollowed_entries(author_ids):
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    sql = f"""
+        DELETE FROM {TimelineEntry._meta.db_table}
+        WHERE author_id IN ({placeholders})
+        AND NOT EXISTS (
+            SELECT 1 FROM {Follow._meta.db_table} follow
+            WHERE follow.user_id = {TimelineEntry._meta.db_table}.user_id
+            AND follow.author_id = {TimelineEntry._meta.db_table}.author_id
+        )
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, author_ids)
+
+
+def reconcile_timelines(author_ids):
+    """Сверяет ленты подписчиков авторов с подписками.
+
+    Фоновые задачи, не успевшие выполниться до остановки процесса,
+    теряются, а задачи одной подписки могут выполниться не по порядку.
+    Здесь удаляются записи без подписки, дописываются недостающие
+    и обновляются пометки pulled. Статистика авторов к этому моменту
+    должна быть пересчитана. Счётчики лент подписок после сверки
+    сбрасываются.
+    """
+    author_ids = iter(author_ids)
+    while True:
+        chunk = list(islice(author_ids, settings.TIMELINE_BATCH_SIZE))
+        if not chunk:
+            break
+        delete_unfollowed_entries(chunk)
+        rebuild_timelines(chunk)
+        pulled = Post.objects.filter(
+            author_id__in=chunk, fanned_out=False).values('author_id')
+        mark_pulled(pulled)
+        Follow.objects.filter(author_id__in=chunk, pulled=True).exclude(
+            author_id__in=pulled).update(pulled=False)
+    counters.reset_follow_counters()
+
+
+def unwrap_entries(entries):
+    return [entry.post for entry in entries]
+
+
+def followed_entries(user_id):
+    """Записи ленты подписок, автор которых ещё в подписках.
+
+    Задачи фан-аута, дозаполнения и очистки одной подписки идут в пуле
+    потоков без общего порядка и могут оставить записи автора, от
+    которого уже отписались; при чтении они пропускаются, а удаляет их
+    reconcile_timelines().
+    """
+    return TimelineEntry.objects.filter(user_id=user_id).annotate(
+        followed=Exists(Follow.objects.filter(
+            user_id=OuterRef('user_id'), author_id=OuterRef('author_id'))),
+    ).filter(followed=True)
+
+
+def pulled_authors(user):
+    """Авторы из подписок, чьи посты подмешиваются при чтении: диапазон
+    частичного индекса follow_pulled."""
+    return list(Follow.objects.filter(user=user, pulled=True).values_list(
+        'author_id', flat=True))
+
+
+def get_follow_page(request, user):
+    """Страница ленты подписок.
+
+    Обычно это один диапазон индекса timeline_user_pub_date. Если среди
+    подписок есть авторы, чьи посты не раскладываются по лентам, к нему
+    добавляется по диапазону post_not_fanned_out на каждого такого
+    автора: каждый читает не больше страницы и строки, а слияние
+    по (pub_date, id) идёт в памяти под общим курсором.
+    """
+    entries = followed_entries(user.id).select_related(
+        'post__author', 'post__group')
+    authors = pulled_authors(user)
+    if not authors:
+        return get_page_context(request, entries, keys=TIMELINE_KEYS,
+                                count_scope=counters.follow_scope(user.id),
+                                transform=unwrap_entries)
+    per_page = settings.POSTS_ON_PAGE
+    sources = [CursorPaginator(entries, per_page, keys=TIMELINE_KEYS,
+                               transform=unwrap_entries)]
+    posts = Post.objects.select_related('author', 'group').filter(
+        fanned_out=False)
+    sources.extend(
+        CursorPaginator(posts.filter(author_id=author_id), per_page)
+        for author_id in authors
+    )
+    return get_merged_page(request, sources, per_page)
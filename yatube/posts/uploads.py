@@ -0,0 +1,155 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+
+from . import cache, thumbnails
+from .imaging import EXTENSIONS, MIME_TYPES, encode_image, make_variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'posts/variants'
+
+_pool = None
+
+
+def get_pool():
+    # spawn, а не fork: пул создаётся из потока фоновых задач,
+    # а fork многопоточного процесса может унести в потомка чужие блокировки.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.UPLOAD_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _pool
+
+
+def temp_path():
+    handle, path = tempfile.mkstemp(dir=settings.FILE_UPLOAD_TEMP_DIR)
+    os.close(handle)
+    return path
+
+
+@contextmanager
+def local_path(storage, name):
+    """Путь к файлу на диске; из удалённого хранилища файл
+    скачивается во временный по частям."""
+    try:
+        yield storage.path(name)
+        return
+    except NotImplementedError:
+        pass
+    path = temp_path()
+    try:
+        with storage.open(name) as source, open(path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def encode(storage, name):
+    """Перекодирует файл name в процессе пула. Возвращает имя нового
+    файла в хранилище или None, если исходный остаётся как есть."""
+    target = temp_path()
+    try:
+        with local_path(storage, name) as source:
+            image_format = get_pool().submit(
+                encode_image, source, target,
+                settings.UPLOAD_IMAGE_MAX_SIZE,
+                settings.UPLOAD_IMAGE_QUALITY,
+                settings.UPLOAD_IMAGE_FORMATS,
+            ).result(timeout=settings.UPLOAD_PROCESS_TIMEOUT)
+        if image_format is None:
+            return None
+        with open(target, 'rb') as encoded:
+            return storage.save(
+                os.path.splitext(name)[0] + EXTENSIONS[image_format],
+                File(encoded))
+    finally:
+        os.remove(target)
+
+
+def build_variants(storage, name):
+    """Создаёт варианты картинки для srcset и возвращает манифест:
+    пропорции кадра и файлы по форматам от узких к широким. None —
+    если ни один из IMAGE_VARIANT_FORMATS недоступен."""
+    with local_path(storage, name) as source:
+        files = get_pool().submit(
+            make_variants, source, settings.FILE_UPLOAD_TEMP_DIR,
+            settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_RATIO,
+            settings.UPLOAD_IMAGE_QUALITY, settings.IMAGE_VARIANT_FORMATS,
+        ).result(timeout=settings.UPLOAD_PROCESS_TIMEOUT)
+    if not files:
+        return None
+    stem = os.path.splitext(os.path.basename(name))[0]
+    sources = {}
+    try:
+        for path, image_format, width, _ in files:
+            with open(path, 'rb') as variant:
+                saved = storage.save(
+                    f'{VARIANTS_DIR}/{stem}-{width}'
+                    f'{EXTENSIONS[image_format]}', File(variant))
+            sources.setdefault(image_format, []).append([saved, width])
+    finally:
+        for path, *_ in files:
+            os.remove(path)
+    width, height = settings.IMAGE_VARIANT_RATIO
+    return {
+        'width': width,
+        'height': height,
+        'sources': [{'type': MIME_TYPES[image_format], 'files': variants}
+                    for image_format, variants in sources.items()],
+    }
+
+
+def delete_variants(manifest):
+    storage = Post._meta.get_field('image').storage
+    for source in manifest['sources']:
+        for name, _ in source['files']:
+            storage.delete(name)
+
+
+def process_post_image(post_id, name):
+    """Фоновая обработка загруженной картинки поста.
+
+    Новый файл подменяет старый, только если картинку поста за это
+    время не сменили. Затем для итогового файла создаются варианты
+    для srcset; если не вышло — хотя бы миниатюры sorl.
+    """
+    storage = Post._meta.get_field('image').storage
+    try:
+        new_name = encode(storage, name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+        new_name = None
+    if new_name is not None:
+        if not Post.objects.filter(pk=post_id, image=name).update(
+                image=new_name):
+            storage.delete(new_name)
+            return
+        storage.delete(name)
+        cache.bump_version(f'post:{post_id}')
+        name = new_name
+    try:
+        manifest = build_variants(storage, name)
+    except Exception:
+        logger.exception('Не удалось создать варианты картинки %s', name)
+        manifest = None
+    if manifest is None:
+        thumbnails.pregenerate(name, post_id)
+        return
+    if not Post.objects.filter(pk=post_id, image=name).update(
+            image_variants=json.dumps(manifest)):
+        delete_variants(manifest)
+        return
+    cache.bump_version(f'post:{post_id}')
@@ -1,9 +1,301 @@
-from django.core.paginator import Paginator
+import base64
+import json
+from datetime import datetime
+
 from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property, lazy
+
+from . import counters
+
+FEED_KEYS = ('pub_date', 'id')
+COMMENT_KEYS = ('created', 'id')
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# Больше не помещается в целое SQLite.
+MAX_OFFSET = 2 ** 63 - 1
+
+
+def encode_cursor(direction, number, values):
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps([direction, number, *values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def date_key(value):
+    """Первый ключ лент и комментариев — дата в ISO 8601."""
+    if not isinstance(value, str):
+        raise ValueError('Некорректный курсор')
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError('Некорректный курсор')
+    return parsed
+
+
+def decode_cursor(cursor, first_key=date_key):
+    """Направление, номер страницы и значения ключей (первый, id).
+
+    Первый ключ проверяет first_key, второй должен быть целым: курсор
+    приходит от клиента, и значения неверного типа иначе дошли бы до
+    фильтра ORM.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, number, *values = json.loads(
+            base64.urlsafe_b64decode(padded.encode()).decode())
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Некорректный курсор')
+    if direction not in (NEXT, PREVIOUS) or type(number) is not int:
+        raise ValueError('Некорректный курсор')
+    if len(values) != 2 or type(values[1]) is not int:
+        raise ValueError('Некорректный курсор')
+    return (direction, max(number, settings.NUMBER_ONE),
+            [first_key(values[0]), values[1]])
+
+
+class CursorPage(Page):
+    """Страница, полученная по курсору: без COUNT(*) и OFFSET."""
+    is_cursor_page = True
+
+    def __init__(self, object_list, number, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, number, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class CursorPaginator(Paginator):
+    """Paginator с курсорным режимом по ключам сортировки (keyset).
+
+    Обычные страницы (?page=N) работают как в Paginator, но получают
+    курсоры соседних страниц, поэтому переходы «вперёд/назад» уходят
+    в курсорный режим, где время ответа не зависит от глубины страницы.
+    """
+
+    def __init__(self, object_list, per_page, keys=FEED_KEYS,
+                 count_scope=None, transform=None, **kwargs):
+        self.keys = keys
+        self.count_scope = count_scope
+        self.transform = transform
+        self.count_is_exact = True
+        object_list = object_list.order_by(*(f'-{key}' for key in keys))
+        super().__init__(object_list, per_page, **kwargs)
 
+    @cached_property
+    def count(self):
+        if self.count_scope is None:
+            return super().count
+        count, self.count_is_exact = counters.get_count(
+            self.count_scope, self.object_list)
+        return count
 
-def get_page_context(request, post_list):
-    paginator = Paginator(post_list, settings.POSTS_ON_PAGE)
+    @property
+    def count_display(self):
+        if self.count_is_exact:
+            return str(self.count)
+        return f'{self.count}+'
+
+    def key_values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def cursor_for(self, direction, number, obj):
+        return encode_cursor(direction, number, self.key_values(obj))
+
+    def keyset_filter(self, values, after):
+        """Строки после (after) или до курсора в порядке убывания ключей."""
+        first, second = self.keys
+        first_value, second_value = values
+        op = 'lt' if after else 'gt'
+        return (
+            Q(**{f'{first}__{op}e': first_value})
+            & (Q(**{f'{first}__{op}': first_value})
+               | Q(**{f'{second}__{op}': second_value}))
+        )
+
+    def fetch(self, values, after):
+        """До per_page + 1 строк после (after) или до курсора values
+        в порядке обхода: вперёд — по убыванию ключей, назад — по
+        возрастанию."""
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, after))
+        if not after:
+            queryset = queryset.reverse()
+        return list(queryset[:self.per_page + 1])
+
+    def cursor_page(self, cursor=None):
+        """Страница по курсору; без курсора — первая страница."""
+        if cursor is None:
+            direction, number, values = NEXT, settings.NUMBER_ONE, None
+        else:
+            direction, number, values = decode_cursor(cursor)
+            if len(values) != len(self.keys):
+                raise ValueError('Некорректный курсор')
+        after = direction == NEXT
+        rows = self.fetch(values, after)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not after:
+            rows.reverse()
+            if not has_more:
+                number = settings.NUMBER_ONE
+        has_next = has_more if after else True
+        has_previous = has_more if not after else values is not None
+        if not rows:
+            return CursorPage(rows, number, self)
+        return CursorPage(
+            self.transform(rows) if self.transform else rows,
+            number,
+            self,
+            next_cursor=(self.cursor_for(NEXT, number + 1, rows[-1])
+                         if has_next else None),
+            previous_cursor=(self.cursor_for(PREVIOUS, number - 1, rows[0])
+                             if has_previous else None),
+        )
+
+    def get_page(self, number):
+        """При приблизительном числе строк номер не зажимается до
+        num_pages: страница читается по OFFSET и дальше листается
+        курсорами, без номера последней страницы."""
+        self.count
+        if self.count_is_exact:
+            return super().get_page(number)
+        return self.offset_page(number)
+
+    def offset_page(self, number):
+        try:
+            number = max(int(number), settings.NUMBER_ONE)
+        except (TypeError, ValueError):
+            number = settings.NUMBER_ONE
+        bottom = (number - settings.NUMBER_ONE) * self.per_page
+        if bottom > MAX_OFFSET:
+            return self.cursor_page()
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows:
+            if number > settings.NUMBER_ONE:
+                return self.cursor_page()
+            return CursorPage(rows, number, self)
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            self.transform(rows) if self.transform else rows,
+            number,
+            self,
+            next_cursor=(self.cursor_for(NEXT, number + 1, rows[-1])
+                         if has_next else None),
+            previous_cursor=(self.cursor_for(PREVIOUS, number - 1, rows[0])
+                             if number > settings.NUMBER_ONE else None),
+        )
+
+    def _get_page(self, object_list, number, paginator):
+        if self.transform:
+            rows = list(object_list)
+            page = super()._get_page(self.transform(rows), number, paginator)
+            if rows:
+                page.next_cursor = self.cursor_for(
+                    NEXT, number + 1, rows[-1])
+                page.previous_cursor = self.cursor_for(
+                    PREVIOUS, number - 1, rows[0])
+            return page
+        page = super()._get_page(object_list, number, paginator)
+        page.next_cursor = lazy(
+            lambda: self.cursor_for(NEXT, page.number + 1, page[-1]), str)()
+        page.previous_cursor = lazy(
+            lambda: self.cursor_for(PREVIOUS, page.number - 1, page[0]),
+            str)()
+        return page
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Одна лента из нескольких источников с общим порядком ключей.
+
+    Источники — CursorPaginator с тем же per_page; после transform
+    их строки должны иметь ключи keys. Каждый источник читает по общему
+    курсору не больше per_page + 1 строк своим диапазоном индекса,
+    а слияние идёт в памяти. Страницы только курсорные: ?page=N
+    отдаёт первую.
+    """
+
+    def __init__(self, sources, per_page, keys=FEED_KEYS):
+        Paginator.__init__(self, [], per_page)
+        self.sources = sources
+        self.keys = keys
+        self.count_scope = None
+        self.count_is_exact = True
+        self.transform = None
+
+    def fetch(self, values, after):
+        rows = {}
+        for source in self.sources:
+            found = source.fetch(values, after)
+            for row in source.transform(found) if source.transform \
+                    else found:
+                rows[row.pk] = row
+        return sorted(rows.values(), key=self.key_values,
+                      reverse=after)[:self.per_page + 1]
+
+    def get_page(self, number):
+        return self.cursor_page()
+
+
+class CappedPaginator(Paginator):
+    """Считает строки не дальше FEED_COUNT_CAP: точное число строк
+    огромной таблицы списку в админке не нужно, а COUNT(*) по ней
+    обходится дорого."""
+
+    @cached_property
+    def count(self):
+        return self.object_list.order_by()[:settings.FEED_COUNT_CAP].count()
+
+
+def get_page_context(request, post_list, keys=FEED_KEYS, count_scope=None,
+                     transform=None):
+    paginator = CursorPaginator(post_list, settings.POSTS_ON_PAGE, keys=keys,
+                                count_scope=count_scope, transform=transform)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            return paginator.cursor_page(cursor)
+        except ValueError:
+            pass
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def get_merged_page(request, sources, per_page=None):
+    paginator = MergedCursorPaginator(
+        sources, per_page or settings.POSTS_ON_PAGE)
+    try:
+        return paginator.cursor_page(request.GET.get('cursor') or None)
+    except ValueError:
+        return paginator.cursor_page()
+
+
+def get_comments_page(request, comments):
+    """Страница комментариев: всегда по курсору, без COUNT(*)."""
+    paginator = CursorPaginator(comments, settings.COMMENTS_ON_PAGE,
+                                keys=COMMENT_KEYS)
+    try:
+        return paginator.cursor_page(request.GET.get('cursor') or None)
+    except ValueError:
+        return paginator.cursor_page()
@@ -1,33 +1,43 @@
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.conf import settings
 
-from .models import Follow, Group, Post, User
-from .forms import CommentForm, PostForm
-from .utils import get_page_context
+from . import counters, identity, search, timeline
+from .export import export_response
+from .conditional import (conditional_page, group_validators,
+                          index_validators, post_validators,
+                          profile_validators)
+from .models import Follow, Post, User
+from .forms import CommentForm, PostForm, SearchForm
+from .stats import get_user_stats
+from .utils import get_comments_page, get_page_context
 
 
+@conditional_page(index_validators)
 def index(request):
     posts = Post.objects.select_related('group', 'author').all()
     context = {
-        'page_obj': get_page_context(request, posts)
+        'page_obj': get_page_context(request, posts,
+                                     count_scope=counters.ALL)
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_validators)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+    group = identity.get_group(slug)
     posts = group.posts.select_related('author')
     context = {
         'group': group,
-        'page_obj': get_page_context(request, posts),
+        'page_obj': get_page_context(
+            request, posts, count_scope=counters.group_scope(group.id)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_validators)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = identity.get_user(username)
     posts = author.posts.select_related('group')
     following = (request.user != author
                  and request.user.is_authenticated
@@ -35,23 +45,77 @@ def profile(request, username):
                                            author=author, ).exists())
     context = {
         'author': author,
-        'page_obj': get_page_context(request, posts),
+        'stats': get_user_stats(author.id),
+        'page_obj': get_page_context(
+            request, posts, count_scope=counters.author_scope(author.id)),
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_validators)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
     form = CommentForm()
     context = {
         'post': post,
+        'author_stats': get_user_stats(post.author_id),
         'form': form,
-        'comments': post.comments.all(),
+        'comments_deferred': settings.COMMENTS_DEFERRED,
     }
+    if not settings.COMMENTS_DEFERRED:
+        context['comments'] = get_comments_page(
+            request, post.comments.select_related('author'))
     return render(request, 'posts/post_detail.html', context)
 
 
+def profile_export(request, username):
+    author = identity.get_user(username)
+    return export_response(request, author.posts.all(), f'{username}-posts')
+
+
+def group_export(request, slug):
+    group = identity.get_group(slug)
+    return export_response(request, group.posts.all(), f'{slug}-posts')
+
+
+def post_search(request):
+    form = SearchForm(request.GET or None)
+    page_obj = None
+    if form.is_valid():
+        author = form.cleaned_data['author']
+        author_id = None
+        if author:
+            found = identity.get_cached(User, 'username', author)
+            author_id = found.pk if found else settings.ZERO
+        group = form.cleaned_data['group']
+        page_obj = search.search_page(
+            form.cleaned_data['q'],
+            group_id=group.pk if group else None,
+            author_id=author_id,
+            cursor=request.GET.get('cursor') or None,
+        )
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+        'query': query.urlencode(),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page(
+            request, post.comments.select_related('author')),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -98,12 +162,10 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.select_related(
-        'author').filter(author__following__user=request.user)
-    paginator = Paginator(posts, settings.POSTS_ON_PAGE)
+    page_obj = timeline.get_follow_page(request, request.user)
     context = {
-        'page_obj': get_page_context(request, posts),
-        'paginator': paginator,
+        'page_obj': page_obj,
+        'paginator': page_obj.paginator,
     }
     return render(request, 'posts/follow.html', context)
 
@@ -111,7 +173,7 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     follower = request.user
-    following = get_object_or_404(User, username=username)
+    following = identity.get_user(username)
     if follower != following:
         Follow.objects.get_or_create(user=follower, author=following)
     return redirect('posts:profile', username=username)
@@ -119,9 +181,10 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
+    author = identity.get_user(username)
     get_object_or_404(
         Follow,
         user=request.user,
-        author__username=username
+        author=author
     ).delete()
     return redirect('posts:profile', username)
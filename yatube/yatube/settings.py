@@ -27,6 +27,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'posts.middleware.InvalidationMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,12 +101,168 @@ POSTS_ON_PAGE = 10
 
 POSTS_ON_SECOND_PAGE = 5
 
+COMMENTS_ON_PAGE = 20
+
+COMMENTS_DEFERRED = False
+
 NUMBER_ONE = 1
 
 ZERO = 0
 
 THIRTY = 30
 
+FEED_COUNT_CAP = 10000
+
+FEED_COUNT_ESTIMATE_TIMEOUT = 300
+
+ADMIN_TEXT_PREVIEW = 60
+
+# Фан-аут, миниатюры и обработка загрузок идут в пуле потоков после
+# коммита. Тесты выполняют их сразу (core.test_runner).
+BACKGROUND_TASKS_ASYNC = True
+
+BACKGROUND_TASKS_WORKERS = 2
+
+TIMELINE_FANOUT_LIMIT = 5000
+
+TIMELINE_BATCH_SIZE = 500
+
+FRAGMENT_CACHE_TIMEOUT = 300
+
+CARD_CACHE_TIMEOUT = 60 * 60
+
+# L1 в памяти процесса для горячих фрагментов и карточек: ключ попадает
+# туда, если прочитан из общего кэша L1_HOT_THRESHOLD раз за окно
+# L1_HOT_WINDOW секунд.
+L1_CACHE_SIZE = 500
+
+L1_HOT_THRESHOLD = 3
+
+L1_HOT_WINDOW = 10
+
+L1_CACHE_TIMEOUT = 30
+
+# Защита от лавины пересчётов фрагментов: блокировка пересчёта, сколько
+# ждать чужой результат, если прежнего значения нет, сколько хранить
+# устаревшее значение и коэффициент раннего обновления XFetch.
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+
+SINGLE_FLIGHT_WAIT = 2
+
+STALE_CACHE_TIMEOUT = 300
+
+XFETCH_BETA = 1.0
+
+# Разрешение общим кэшам отдавать устаревшую страницу, пока она
+# обновляется или если сайт отвечает ошибкой.
+PAGE_STALE_WHILE_REVALIDATE = 30
+
+PAGE_STALE_IF_ERROR = 600
+
+# Шина инвалидации: как часто процесс дочитывает события, сколько
+# событий за раз и сколько секунд они хранятся в таблице.
+INVALIDATION_POLL_INTERVAL = 1
+
+INVALIDATION_BATCH_SIZE = 1000
+
+INVALIDATION_RETENTION = 60 * 60
+
+# Сколько секунд ждать строку события, закоммиченную позже строк
+# с большими id. Дольше не нужно: записи L1 к тому времени истекут.
+INVALIDATION_GAP_TIMEOUT = L1_CACHE_TIMEOUT
+
+# Кэш поиска групп по slug и пользователей по username: найденные
+# объекты и, недолго, отсутствие — чтобы несуществующие адреса
+# не доходили до базы.
+IDENTITY_CACHE_TIMEOUT = 60 * 60
+
+IDENTITY_NEGATIVE_TIMEOUT = 60
+
+# Размеры миниатюр из шаблонов: создаются заранее при сохранении поста.
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.PregeneratingBackend'
+
+THUMBNAIL_LOCK_TIMEOUT = 60
+
+THUMBNAIL_LRU_SIZE = 10000
+
+# Загрузки больше этого размера пишутся во временный файл, а не в память.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024
+
+FILE_UPLOAD_TEMP_DIR = None
+
+UPLOAD_PROCESS_WORKERS = 2
+
+UPLOAD_PROCESS_TIMEOUT = 60
+
+UPLOAD_IMAGE_MAX_SIZE = 2048
+
+UPLOAD_IMAGE_QUALITY = 82
+
+# Первый формат, который поддерживает установленный Pillow.
+UPLOAD_IMAGE_FORMATS = ('WEBP', 'JPEG')
+
+# Варианты картинки поста для srcset: кадр карточки ленты в нескольких
+# ширинах и во всех форматах, которые поддерживает установленный Pillow.
+IMAGE_VARIANT_RATIO = (960, 339)
+
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+
+IMAGE_VARIANT_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+
+IMAGE_VARIANT_SIZES = '(min-width: 992px) 960px, 100vw'
+
+PAGE_SHARED_CACHE_MAX_AGE = 60
+
+QUERY_BUDGET_DEFAULT = 20
+
+QUERY_BUDGETS = {
+    'posts:index': 8,
+    'posts:group_list': 10,
+    'posts:profile': 12,
+    'posts:post_detail': 10,
+    'posts:post_comments': 6,
+    'posts:follow_index': 10,
+    'posts:post_search': 6,
+}
+
+# Бюджеты запросов, которые заполняют общий кэш: рендер фрагментов,
+# карточек и счётчиков лент.
+QUERY_BUDGETS_COLD = {
+    'posts:index': 16,
+    'posts:group_list': 18,
+    'posts:profile': 24,
+    'posts:post_detail': 18,
+    'posts:post_comments': 10,
+    'posts:follow_index': 16,
+    'posts:post_search': 10,
+}
+
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_TIME_BUDGET = 10
+
+METRICS_ENABLED = True
+
+METRICS_DIR = os.path.join(BASE_DIR, 'var', 'metrics')
+
+METRICS_FLUSH_INTERVAL = 5
+
+METRICS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+# /metrics открыт персоналу сайта и запросам с заголовком
+# «Authorization: Bearer <METRICS_TOKEN>»; без токена доступ выключен.
+# Доступ по адресу — только если воркеры принимают соединения напрямую:
+# за локальным обратным прокси каждый запрос приходит с 127.0.0.1.
+METRICS_TOKEN = None
+
+METRICS_ALLOWED_IPS = ()
+
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = (
@@ -122,6 +281,8 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+TEST_RUNNER = 'core.test_runner.InlineTasksRunner'
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -132,8 +293,16 @@ ALLOWED_HOSTS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех процессов кэш в файле SQLite: версии лент, карточки
+# и блокировки видны каждому воркеру. Каталог создаётся с правами 0700
+# и должен принадлежать пользователю сайта: значения — это pickle.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'var', 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+        },
     }
 }
@@ -9,6 +9,7 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('', include('core.urls', namespace='core')),
 ]
 
 handler404 = 'core.views.page_not_found'